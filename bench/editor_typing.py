@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+# Typing latency in the note editor: keypress plus redraw of one
+# screen, for the old urwid.Edit based BufferEdit and for BufferView,
+# with the cursor in the middle of a large note. Also times the motions
+# BufferView adds.
+#
+#   python3 bench/editor_typing.py [kilobytes] [keys]
+import os
+import sys
+import time
+import statistics
+import urwid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from enpda.textbuffer import BufferView
+
+size = (80, 40)
+
+class BufferEdit(urwid.Edit):
+    """The note editor's body before BufferView."""
+    def __init__(self, content):
+        super().__init__(edit_text=content or '', multiline=True)
+
+def generate(kilobytes):
+    line = 'Feb  1 10:00:00 enpda kernel[1]: a line of a pasted log, %06d\n'
+    lines = []
+    total = 0
+    while total < kilobytes * 1024:
+        lines.append(line % len(lines))
+        total += len(lines[-1])
+    return ''.join(lines)
+
+def timed(fn, keys):
+    latencies = []
+    for _ in range(keys):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def report(name, latencies):
+    print('%-24s median %8.2f ms   max %8.2f ms' % (
+        name, statistics.median(latencies) * 1000, max(latencies) * 1000,
+    ))
+
+def old_editor(text):
+    edit = BufferEdit(text)
+    edit.set_edit_pos(len(text) // 2)
+    widget = urwid.Filler(edit, 'top')
+    widget.render(size, True)
+
+    def type_key():
+        widget.keypress(size, 'x')
+        widget.render(size, True)
+    return type_key
+
+def new_editor(text):
+    widget = BufferView(text)
+    widget.set_cursor(len(text) // 2)
+    widget.render(size, True)
+
+    def type_key():
+        widget.keypress(size, 'x')
+        widget.render(size, True)
+    return widget, type_key
+
+def main():
+    kilobytes = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    keys = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    text = generate(kilobytes)
+    print('%d kB note, %d lines, %d keys' % (kilobytes, text.count('\n'), keys))
+
+    report('BufferEdit', timed(old_editor(text), keys))
+    widget, type_key = new_editor(text)
+    report('BufferView', timed(type_key, keys))
+    for motion in ['w', 'b', '$', 'G', 'g', 'j']:
+        report('BufferView %s' % motion, timed(lambda: widget.move(motion), keys))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# Bytes per event held by the schedule model, compared to the previous
+# representation: plain objects with a __dict__, per-event copies of
+# track/room/date strings and authors, and the raw description and
+# abstract HTML on every event.
+#
+#   python3 bench/fosdem_memory.py [events]
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+from enpda.data import Data
+from enpda.fosdem import Fosdem
+from fosdem_parse import generate
+
+class OldAuthor:
+    def __init__(self, name, fosdem_id):
+        self.fosdem_id = fosdem_id
+        self.name = name
+
+class OldAuthors:
+    def __init__(self, authors):
+        self.authors = authors
+
+class OldEvent:
+    def __init__(self, title, authors, track, room, date, duration, start_time,
+                 description, abstract, fosdem_id):
+        self.title = title
+        self.authors = authors
+        self.track = track
+        self.room = room
+        self.date = date
+        self.duration = duration
+        self.start_time = start_time
+        self._description = description
+        self._abstract = abstract
+        self.fosdem_id = fosdem_id
+
+def old_model(fosdem):
+    # Copy every string, like a fresh xpath().text per event would give.
+    copy = lambda s: (s + '.')[:-1] if s else s
+    events = []
+    for ev in fosdem.events:
+        description, abstract = ev.texts
+        events.append(OldEvent(
+            title=copy(ev.title),
+            authors=OldAuthors([
+                OldAuthor(copy(a.name), copy(a.fosdem_id)) for a in ev.authors.authors
+            ]),
+            track=copy(ev.track), room=copy(ev.room), date=copy(ev.date),
+            duration=copy(ev.duration), start_time=copy(ev.start_time),
+            description=copy(description), abstract=copy(abstract),
+            fosdem_id=copy(ev.fosdem_id),
+        ))
+    return events
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, used
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'schedule.xml')
+        generate(path, count)
+        data = Data(os.path.join(tmp, 'data.db'))
+        Fosdem.from_file(path, data)
+
+        fosdem, new = measure(lambda: Fosdem.from_file(path, data))
+        events = len(fosdem._by_id)
+        _, old = measure(lambda: old_model(fosdem))
+
+        print('%d events' % events)
+        print('before: %7.0f bytes/event' % (old / events))
+        print('after:  %7.0f bytes/event' % (new / events))
+
+if __name__ == '__main__':
+    main()
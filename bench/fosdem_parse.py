@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+# Peak RSS and parse time of the streaming schedule loader, compared to
+# the previous loader that parsed the whole tree and ran one XPath query
+# per event field. Each loader runs in a fresh process.
+#
+#   python3 bench/fosdem_parse.py [events]
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from enpda.fosdem import Fosdem
+
+def generate(path, count, rooms=40, days=4):
+    per_room = max(1, count // (rooms * days))
+    eid = 0
+    with open(path, 'w') as fh:
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n<schedule>\n')
+        for day in range(1, days + 1):
+            fh.write('<day index="%d" date="2020-02-%02d">\n' % (day, day))
+            for room in range(rooms):
+                fh.write('<room name="room %d">\n' % room)
+                for n in range(per_room):
+                    eid += 1
+                    fh.write(
+                        '<event id="%d"><start>%02d:%02d</start><duration>00:25</duration>'
+                        '<room>room %d</room><title>Talk number %d</title>'
+                        '<track>Track %d</track><type>devroom</type>'
+                        '<abstract>&lt;p&gt;%s&lt;/p&gt;</abstract>'
+                        '<description>&lt;p&gt;%s&lt;/p&gt;</description>'
+                        '<persons><person id="%d">Speaker %d</person></persons>'
+                        '<links/></event>\n' % (
+                            eid, 9 + n // 2 % 12, n % 2 * 30, room, eid, room,
+                            'abstract text ' * 20, 'description text ' * 80,
+                            eid % 5000, eid % 5000,
+                        ))
+                fh.write('</room>\n')
+            fh.write('</day>\n')
+        fh.write('</schedule>\n')
+
+def tree_loader(fh):
+    from lxml import etree
+    fosdem = Fosdem(None, None)
+
+    def authors(ev):
+        return [(p.text, p.get('id')) for p in ev.xpath('./persons/person')]
+
+    def attr(ev, key):
+        return ev.xpath('./%s' % key)[0].text
+
+    tree = etree.parse(fh)
+    for day in tree.xpath('/schedule/day'):
+        dayidx = int(day.get('index'))
+        date = day.get('date')
+        fosdem.add_day(dayidx)
+        for ev in day.xpath('./room/event'):
+            track = 'Day %d: %s' % (dayidx, attr(ev, 'track'))
+            room = attr(ev, 'room')
+            fosdem.add_track(track, dayidx, date, room)
+            fosdem.add_event(
+                date=date, fosdem_id=ev.get('id'), title=attr(ev, 'title'),
+                authors=authors(ev), track=track, room=room,
+                duration=attr(ev, 'duration'), start_time=attr(ev, 'start'),
+                description=attr(ev, 'description'), abstract=attr(ev, 'abstract'),
+            )
+    return fosdem
+
+def run(loader, path):
+    # lxml is imported up front so both loaders pay for it equally.
+    from lxml import etree
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(path, 'rb') as fh:
+        if loader == 'tree':
+            fosdem = tree_loader(fh)
+        else:
+            fosdem = Fosdem(fh, None)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    print('%-10s %8.2fs  peak +%6.1f MB  (%d events)' % (
+        loader, elapsed, peak / 1024, len(fosdem._by_id),
+    ))
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--run':
+        return run(sys.argv[2], sys.argv[3])
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'schedule.xml')
+        generate(path, count)
+        print('%.1f MB of XML' % (os.path.getsize(path) / 1e6))
+        for loader in ['tree', 'iterparse']:
+            subprocess.run([sys.executable, __file__, '--run', loader, path], check=True)
+
+if __name__ == '__main__':
+    main()
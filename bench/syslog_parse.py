@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# Compare a full parse of a large log through SyslogLine, one line at a
+# time, with the chunked parse_columns() process pool.
+#
+#   python3 bench/syslog_parse.py [lines] [workers]
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from enpda.syslog import SyslogLine, parse_columns
+
+def generate(path, count):
+    services = ['kernel', 'systemd', 'sshd', 'cron', 'NetworkManager', 'dbus-daemon']
+    with open(path, 'w') as fh:
+        for i in range(count):
+            sec = i // 20
+            fh.write('Feb %2d %02d:%02d:%02d enpda %s[%d]: message number %d\n' % (
+                1 + sec // 86400 % 28, sec // 3600 % 24, sec // 60 % 60, sec % 60,
+                services[i % len(services)], 100 + i % 900, i,
+            ))
+
+def per_line(path):
+    services = {}
+    times = []
+    with open(path) as fh:
+        for line in fh:
+            entry = SyslogLine(line.rstrip('\n'))
+            services.setdefault(entry.service, len(services))
+            times.append(entry.timekey)
+    return len(times)
+
+def columns(path, workers):
+    return len(parse_columns(path, workers=workers))
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'syslog')
+        generate(path, count)
+        print('%d lines, %.1f MB, %d cpus' % (
+            count, os.path.getsize(path) / 1e6, os.cpu_count(),
+        ))
+        for name, func in [
+            ('SyslogLine', lambda: per_line(path)),
+            ('parse_columns', lambda: columns(path, workers)),
+        ]:
+            start = time.perf_counter()
+            n = func()
+            elapsed = time.perf_counter() - start
+            print('%-14s %8.2fs  %10.0f lines/s' % (name, elapsed, n / elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 #!/usr/bin/python3
 import os
 import sys
+import signal
 import urwid
 from urwid.command_map import command_map, CURSOR_UP, CURSOR_DOWN
 from enpda.app import App
 from enpda.views import FosdemView, SyslogView, NotesView
 from enpda.fosdem import Fosdem
+from enpda.conferences import ConferenceLibrary
 
 palette = [
     ('header', 'white', 'dark blue'),
@@ -13,13 +15,31 @@ palette = [
     ('nav', 'white', 'dark blue'),
     ('search', 'white', 'dark blue'),
     ('success', 'black,bold', 'dark green'),
+    ('error', 'white,bold', 'dark red'),
     ('active', 'default,bold,underline', 'default'),
+    ('favorite', 'yellow,bold', 'default'),
 ]
 
+def load_fosdem(app, fosdem_xml, key):
+    fosdem = Fosdem.from_file(fosdem_xml, app.data, key=key, favorites=app.favorites)
+    if os.environ.get('ENPDA_PRECOMPUTE', '1') != '0':
+        fosdem.precompute_texts()
+    return fosdem
+
+libraries = {}
+
 def fosdem(app, fosdem_xml=None):
     if fosdem_xml is None:
         fosdem_xml = os.environ.get('ENPDA_FOSDEM', '/var/lib/enpda/fosdem.xml')
-    fosdem = Fosdem.from_file(fosdem_xml, app.data)
+    if os.path.isdir(fosdem_xml):
+        if fosdem_xml not in libraries:
+            libraries[fosdem_xml] = ConferenceLibrary(
+                fosdem_xml, app.data,
+                lambda path, key: load_fosdem(app, path, key),
+                budget=int(os.environ.get('ENPDA_CONFERENCE_BUDGET', 64)) * 1024 * 1024,
+            )
+        return FosdemView(app, library=libraries[fosdem_xml])
+    fosdem = load_fosdem(app, fosdem_xml, os.environ.get('ENPDA_CONFERENCE', 'fosdem2020'))
     return FosdemView(app, fosdem=fosdem)
 
 views = [
@@ -31,11 +51,22 @@ views = [
 command_map['k'] = CURSOR_UP
 command_map['j'] = CURSOR_DOWN
 
-app = App('enpda', views, dbpath=os.environ.get('ENPDA_DB', '/var/lib/enpda/data.db'))
+app = App(
+    'enpda', views,
+    dbpath=os.environ.get('ENPDA_DB', '/var/lib/enpda/data.db'),
+    wal=os.environ.get('ENPDA_DB_WAL', '1') != '0',
+)
 
 
 loop = urwid.MainLoop(
     app, palette,
     unhandled_input=app.on_unhandled_input,
 )
-loop.run()
+app.loop = loop
+if os.environ.get('ENPDA_DB_ASYNC', '1') != '0':
+    app.data.start_writer(loop)
+signal.signal(signal.SIGTERM, lambda signum, frame: app.terminate())
+try:
+    loop.run()
+finally:
+    app.data.flush()
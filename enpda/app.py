@@ -1,11 +1,14 @@
 import urwid
 from enpda.data import Data
+from enpda.favorites import FavoritesStore
 from enpda.widgets import Header, NavMenu
 
 class App(urwid.Frame):
-    def __init__(self, name, views, dbpath='/var/lib/ui/data.db', title=None):
+    def __init__(self, name, views, dbpath='/var/lib/ui/data.db', title=None, wal=False):
         self.name = name
-        self.data = Data(dbpath)
+        self.loop = None
+        self.data = Data(dbpath, wal=wal)
+        self.favorites = FavoritesStore(self.data)
         self.view_list = [x[0] for x in views]
         self.views = {x[0]: x[1] for x in views}
         self.current_view = self.view_list[0]
@@ -20,6 +23,7 @@ class App(urwid.Frame):
         )
 
     def terminate(self):
+        self.data.flush()
         raise urwid.ExitMainLoop()
 
     def keypress(self, size, key):
@@ -46,4 +50,4 @@ class App(urwid.Frame):
 
     def on_unhandled_input(self, key):
         if key == 'q':
-            raise urwid.ExitMainLoop()
+            self.terminate()
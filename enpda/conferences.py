@@ -0,0 +1,153 @@
+import os
+import json
+from collections import OrderedDict
+import urwid
+from enpda.widgets import SelectableText
+from enpda import ical
+
+class ConferenceHeader:
+    """Title, dates and event count of a schedule file, without loading it.
+
+    Title and dates come from the first few elements of the XML; the
+    event count from a plain byte scan, remembered in Data per mtime and
+    size so it's only done once per version of the file.
+    """
+    hashkey = 'conference_header'
+
+    def __init__(self, path, title, start, end, events):
+        self.path = path
+        self.title = title
+        self.start = start
+        self.end = end
+        self.events = events
+
+    @property
+    def key(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @classmethod
+    def read(cls, path, data):
+        st = os.stat(path)
+        stamp = '%d_%d' % (st.st_mtime_ns, st.st_size)
+        cached = data.get_value(cls.hashkey, path)
+        if cached is not None:
+            cached = json.loads(cached)
+            if cached.pop('stamp') == stamp:
+                return cls(path, **cached)
+
+        header = cls(path, *cls.read_info(path), cls.count_events(path))
+        value = json.dumps({
+            'stamp': stamp, 'title': header.title, 'start': header.start,
+            'end': header.end, 'events': header.events,
+        })
+        if cached is None:
+            data.insert(cls.hashkey, path, value)
+        else:
+            data.update(cls.hashkey, path, value)
+        return header
+
+    @staticmethod
+    def read_info(path):
+        if path.endswith('.ics'):
+            with open(path, 'rb') as fh:
+                return ical.calendar_name(fh) or os.path.basename(path), None, None
+
+        from lxml import etree
+        info = {}
+        with open(path, 'rb') as fh:
+            for action, el in etree.iterparse(fh, events=('start', 'end')):
+                if action == 'start' and el.tag == 'day':
+                    info.setdefault('start', el.get('date'))
+                    break
+                if action == 'end' and el.tag in ['title', 'start', 'end']:
+                    info.setdefault(el.tag, el.text)
+                if action == 'end' and el.tag == 'conference':
+                    break
+        title = info.get('title') or os.path.basename(path)
+        return title, info.get('start'), info.get('end')
+
+    @staticmethod
+    def count_events(path, block_size=1024 * 1024):
+        marker = b'BEGIN:VEVENT' if path.endswith('.ics') else b'<event '
+        count = 0
+        tail = b''
+        with open(path, 'rb') as fh:
+            for block in iter(lambda: fh.read(block_size), b''):
+                data = tail + block
+                count += data.count(marker)
+                tail = data[1-len(marker):]
+        return count
+
+    def __str__(self):
+        dates = ' - '.join(d for d in [self.start, self.end] if d)
+        return '%s (%s, %d events)' % (self.title, dates or '?', self.events)
+
+class ConferenceLibrary:
+    """Schedules found in a directory, loaded when first opened.
+
+    Loaded schedules stay around in least recently used order, as long
+    as their estimated size fits in budget bytes; the one most recently
+    opened is always kept. A schedule is estimated at its stored event
+    text plus event_size bytes per event for the model itself, which is
+    about what bench/fosdem_memory.py measures.
+    """
+    extensions = ['.xml', '.ics']
+    event_size = 768
+
+    def __init__(self, path, data, load, budget=64 * 1024 * 1024):
+        self.path = path
+        self.data = data
+        self.load = load
+        self.budget = budget
+        self.loaded = OrderedDict()
+        self.headers = []
+
+    def scan(self):
+        """Reread the directory, dropping loaded schedules whose file is
+        gone; headers are cached, so this is cheap for unchanged files."""
+        headers = []
+        for name in sorted(os.listdir(self.path)):
+            if os.path.splitext(name)[1] not in self.extensions:
+                continue
+            headers.append(ConferenceHeader.read(os.path.join(self.path, name), self.data))
+        paths = {header.path for header in headers}
+        for path in [path for path in self.loaded if path not in paths]:
+            self.loaded.pop(path)[0].close()
+        self.headers = headers
+        return headers
+
+    def size(self, fosdem):
+        return fosdem.text_size() + len(fosdem._by_id) * self.event_size
+
+    def open(self, header):
+        try:
+            self.loaded.move_to_end(header.path)
+            return self.loaded[header.path][0]
+        except KeyError:
+            pass
+        fosdem = self.load(header.path, header.key)
+        self.loaded[header.path] = (fosdem, self.size(fosdem))
+        used = sum(size for _, size in self.loaded.values())
+        while used > self.budget and len(self.loaded) > 1:
+            _, (evicted, size) = self.loaded.popitem(last=False)
+            evicted.close()
+            used -= size
+        return fosdem
+
+class ConferenceList(urwid.ListBox):
+    def __init__(self, library, on_open):
+        self.library = library
+        self.on_open = on_open
+        self.items = [ConferenceItem(header) for header in library.scan()]
+        super().__init__(urwid.SimpleFocusListWalker(self.items))
+
+    def keypress(self, size, key):
+        if key == 'enter' and self.focus is not None:
+            self.on_open(self.focus.header)
+            return
+        return super().keypress(size, key)
+
+class ConferenceItem(SelectableText):
+    def __init__(self, header):
+        self.header = header
+        super().__init__(str(header))
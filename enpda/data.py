@@ -1,56 +1,331 @@
+import os
+import queue
+import logging
+import operator
 import sqlite3
 import secrets
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
 class Data:
-    def __init__(self, dbpath):
+    """The dynamo table, with an LRU read cache in front of it.
+
+    Single values (misses included) and whole collections are cached
+    separately, and dropped by any write to them through this object;
+    writes made through another connection are not seen.
+
+    set_value() and delete_value() are the writes that may be deferred:
+    after start_writer() they go to a DataWriter instead of blocking the
+    caller, and reads see them right away. Hooks added for a hashkey run
+    in the same transaction as each of those writes under it.
+    """
+    schema_version = 2
+
+    def __init__(self, dbpath, wal=False, cache_size=1024, collection_cache_size=32):
+        self.dbpath = dbpath
+        self.wal = wal
         self.db = sqlite3.connect(dbpath, isolation_level=None)
+        self._batch_depth = 0
+        self.cache_size = cache_size
+        self.collection_cache_size = collection_cache_size
+        self._values = OrderedDict()
+        self._collections = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.writer = None
+        self.write_hooks = {}
+        if wal:
+            # With WAL, commits only need an fsync at checkpoints.
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
         try:
-            self.schema = self.get_config('schema')
+            self.schema = int(self.get_config('schema'))
         except sqlite3.OperationalError as exc:
             if not exc.args[0].startswith('no such table:'):
                 raise
             self.init_db()
+        self.migrate()
+
+    def migrate(self):
+        while self.schema < self.schema_version:
+            with self.batch():
+                getattr(self, 'migrate_%d' % (self.schema + 1))()
+                self.schema += 1
+                self.update('config', 'schema', self.schema)
+
+    def migrate_2(self):
+        # Cluster rows on (hashkey, sortkey), so range scans read
+        # neighbouring rows instead of going through a separate index.
+        self.db.execute('''
+            CREATE TABLE dynamo_new (
+                hashkey TEXT NOT NULL,
+                sortkey TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (hashkey, sortkey)
+            ) WITHOUT ROWID;
+        ''')
+        self.db.execute('INSERT INTO dynamo_new SELECT hashkey, sortkey, value FROM dynamo')
+        self.db.execute('DROP TABLE dynamo')
+        self.db.execute('ALTER TABLE dynamo_new RENAME TO dynamo')
+        self.clear_cache()
 
     def init_db(self):
-        self.schema = 1
+        """Create the table at the current schema; the migrations are
+        only for databases made by older versions."""
+        self.schema = self.schema_version
         self.db.execute('''
             CREATE TABLE dynamo (
-                hashkey VARCHAR NOT NULL,
-                sortkey VARCHAR NOT NULL,
+                hashkey TEXT NOT NULL,
+                sortkey TEXT NOT NULL,
                 value TEXT,
-                unique(hashkey, sortkey)
-            );
+                PRIMARY KEY (hashkey, sortkey)
+            ) WITHOUT ROWID;
         ''')
         self.insert('config', 'schema', self.schema)
 
+    @contextmanager
+    def batch(self):
+        """Run the writes made inside the block in one transaction.
+        Nested batches join the outermost one.
+
+        The write lock is taken up front, so a batch that reads before it
+        writes can't fail with a locked database halfway through."""
+        self._batch_depth += 1
+        if self._batch_depth > 1:
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            return
+
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            # Reads inside the batch may have cached what was rolled back.
+            self.clear_cache()
+            raise
+        else:
+            self.db.execute('COMMIT')
+        finally:
+            self._batch_depth = 0
+
+    def _cached(self, cache, key):
+        try:
+            value = cache[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _cache(self, cache, key, value, size):
+        if size <= 0:
+            return
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+    def _invalidate(self, hashkey, sortkey):
+        self._values.pop((hashkey, sortkey), None)
+        self._collections.pop(hashkey, None)
+
+    def clear_cache(self):
+        self._values.clear()
+        self._collections.clear()
+
+    @property
+    def cache_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'values': len(self._values),
+            'collections': len(self._collections),
+        }
+
+    def cache_path(self, name):
+        """A directory for derived data, kept next to the database."""
+        path = os.path.join(os.path.dirname(os.path.abspath(self.dbpath)), 'cache', name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
     def get_config(self, what):
         return self.get_value('config', what)
 
+    def start_writer(self, loop=None):
+        """Defer set_value() and delete_value() to a writer thread. With
+        an urwid loop, their callbacks are run from it."""
+        if self.writer is None:
+            self.writer = DataWriter(self, loop)
+        return self.writer
+
+    def add_write_hook(self, hashkey, hook):
+        """Have hook(data, op, sortkey, value) called for every
+        set_value() and delete_value() under hashkey, inside the batch
+        that stores it; data is the Data object doing the write."""
+        self.write_hooks[hashkey] = hook
+
+    def flush(self):
+        """Wait for deferred writes to reach the database."""
+        if self.writer is not None:
+            self.writer.flush()
+
     def get_value(self, hashkey, sortkey):
+        key = (str(hashkey), str(sortkey))
+        if self.writer is not None:
+            try:
+                value = self.writer.pending_value(key)
+                self.hits += 1
+                return value
+            except KeyError:
+                pass
+        try:
+            return self._cached(self._values, key)
+        except KeyError:
+            pass
         try:
-            return list(self.db.execute(
-                'SELECT value FROM dynamo WHERE hashkey=? AND sortkey=?', (
-                    str(hashkey),
-                    str(sortkey)
-                )
+            value = list(self.db.execute(
+                'SELECT value FROM dynamo WHERE hashkey=? AND sortkey=?', key
             ))[0][0]
         except IndexError:
-            return
+            value = None
+        self._cache(self._values, key, value, self.cache_size)
+        return value
+
+    def get_many(self, hashkey, sortkeys):
+        """Values of several sortkeys under hashkey, as a dict. Keys
+        without a row are left out."""
+        hashkey = str(hashkey)
+        values = {}
+        missing = []
+        for sortkey in map(str, sortkeys):
+            try:
+                if self.writer is not None:
+                    try:
+                        values[sortkey] = self.writer.pending_value((hashkey, sortkey))
+                        self.hits += 1
+                        continue
+                    except KeyError:
+                        pass
+                values[sortkey] = self._cached(self._values, (hashkey, sortkey))
+            except KeyError:
+                missing.append(sortkey)
+
+        # Keep below sqlite's limit on bound parameters.
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i+500]
+            found = dict(self.db.execute('''
+                SELECT sortkey, value FROM dynamo
+                WHERE hashkey=? AND sortkey IN (%s)
+            ''' % ','.join('?' * len(chunk)), [hashkey] + chunk))
+            for sortkey in chunk:
+                values[sortkey] = found.get(sortkey)
+                self._cache(self._values, (hashkey, sortkey), values[sortkey], self.cache_size)
+
+        return {k: v for k, v in values.items() if v is not None}
 
     def get_collection(self, what):
-        return self.db.execute('''
-            SELECT hashkey, sortkey, value
-            FROM dynamo
-            WHERE hashkey=?
-            ORDER BY sortkey
-        ''', (str(what), ))
+        what = str(what)
+        try:
+            rows = self._cached(self._collections, what)
+        except KeyError:
+            rows = tuple(self.db.execute('''
+                SELECT hashkey, sortkey, value
+                FROM dynamo
+                WHERE hashkey=?
+                ORDER BY sortkey
+            ''', (what, )))
+            self._cache(self._collections, what, rows, self.collection_cache_size)
+        if self.writer is not None:
+            rows = self.writer.overlay(what, rows)
+        return rows
+
+    scan_bounds = [
+        ('start', operator.ge, '>='),
+        ('after', operator.gt, '>'),
+        ('end', operator.lt, '<'),
+        ('before', operator.lt, '<'),
+    ]
+
+    def _scan(self, columns, hashkey, prefix=None, limit=None, reverse=False, **bounds):
+        hashkey = str(hashkey)
+        conditions = [
+            (sql, op, str(bounds[name])) for name, op, sql in self.scan_bounds
+            if bounds[name] is not None
+        ]
+        if prefix is not None:
+            prefix = str(prefix)
+            conditions += [
+                ('>=', operator.ge, prefix),
+                ('<', operator.lt, prefix + '\U0010ffff'),
+            ]
+
+        changes = {}
+        if self.writer is not None:
+            changes = self.writer.changes(hashkey)
+        query = 'SELECT %s FROM dynamo WHERE hashkey=?%s ORDER BY sortkey %s' % (
+            columns,
+            ''.join(' AND sortkey %s ?' % sql for sql, _, _ in conditions),
+            'DESC' if reverse else 'ASC',
+        )
+        args = [hashkey] + [value for _, _, value in conditions]
+        if limit is not None:
+            # Pending deletes may take rows out of the page.
+            query += ' LIMIT ?'
+            args.append(limit + len(changes))
+        rows = list(self.db.execute(query, args))
+        if changes:
+            rows = self.writer.overlay(
+                hashkey, rows, changes,
+                lambda sortkey: all(op(sortkey, value) for _, op, value in conditions),
+                reverse,
+            )
+        return tuple(rows[:limit])
+
+    def scan(self, hashkey, prefix=None, start=None, end=None, limit=None, after=None,
+             before=None, reverse=False):
+        """Rows of hashkey in sortkey order, from start (inclusive) to end
+        (exclusive), optionally only those starting with prefix.
+
+        after and before are for paging: pass the last sortkey of one page
+        to get the next, rather than an offset.
+        """
+        return self._scan(
+            'hashkey, sortkey, value', hashkey, prefix, limit, reverse,
+            start=start, end=end, after=after, before=before,
+        )
+
+    def scan_keys(self, hashkey, prefix=None, start=None, end=None, limit=None, after=None,
+                  before=None, reverse=False):
+        """Like scan(), but only the sortkeys, leaving the values unread."""
+        return tuple(row[1] for row in self._scan(
+            'hashkey, sortkey, NULL', hashkey, prefix, limit, reverse,
+            start=start, end=end, after=after, before=before,
+        ))
 
     def insert(self, hashkey, sortkey, value):
+        self._invalidate(str(hashkey), str(sortkey))
         return self.db.execute('''
             INSERT INTO dynamo VALUES (?, ?, ?)
         ''', [str(hashkey), str(sortkey), str(value)])
 
+    def insert_many(self, hashkey, items):
+        """Insert (sortkey, value) pairs under hashkey, all or nothing."""
+        hashkey = str(hashkey)
+        rows = [(hashkey, str(sortkey), str(value)) for sortkey, value in items]
+        for _, sortkey, _ in rows:
+            self._invalidate(hashkey, sortkey)
+        with self.batch():
+            return self.db.executemany('''
+                INSERT INTO dynamo VALUES (?, ?, ?)
+            ''', rows)
+
     def update(self, hashkey, sortkey, value):
+        self._invalidate(str(hashkey), str(sortkey))
         return self.db.execute('''
             UPDATE dynamo
             SET value=?
@@ -58,7 +333,159 @@ class Data:
         ''', [str(value), str(hashkey), str(sortkey)])
 
     def delete(self, hashkey, sortkey):
+        self._invalidate(str(hashkey), str(sortkey))
         return self.db.execute('''
             DELETE FROM dynamo
             WHERE hashkey=? AND sortkey=?
         ''', [str(hashkey), str(sortkey)])
+
+    def put(self, hashkey, sortkey, value):
+        self._invalidate(str(hashkey), str(sortkey))
+        return self.db.execute('''
+            INSERT OR REPLACE INTO dynamo VALUES (?, ?, ?)
+        ''', [str(hashkey), str(sortkey), str(value)])
+
+    def store(self, op, key, value, hook=None):
+        if op == 'put':
+            self.put(*key, value)
+        else:
+            self.delete(*key)
+        if hook is not None:
+            hook(self, op, key[1], value)
+
+    def set_value(self, hashkey, sortkey, value, callback=None):
+        """Insert or replace a value. callback(error) is called once it is
+        stored, error being None if all went well."""
+        self._write('put', hashkey, sortkey, value, callback)
+
+    def delete_value(self, hashkey, sortkey, callback=None):
+        """Like delete(), but may be deferred as set_value()."""
+        self._write('delete', hashkey, sortkey, None, callback)
+
+    def _write(self, op, hashkey, sortkey, value, callback):
+        key = (str(hashkey), str(sortkey))
+        if self.writer is not None:
+            self._invalidate(*key)
+            self.writer.write(op, key, value, callback)
+            return
+        try:
+            with self.batch():
+                self.store(op, key, value, self.write_hooks.get(key[0]))
+        except sqlite3.Error as exc:
+            if callback is None:
+                raise
+            callback(exc)
+        else:
+            if callback is not None:
+                callback(None)
+
+class DataWriter:
+    """Writes for a Data object, made by a thread with its own connection.
+
+    Writes queued up while the thread is busy are coalesced per key, the
+    last one winning, and committed in one transaction. Until the main
+    thread has seen them committed, they are kept in pending to be
+    overlaid on reads. Completion is handed back through a pipe watched
+    by the urwid loop, or by flush() without one.
+    """
+    def __init__(self, data, loop=None):
+        self.data = data
+        self.lock = threading.Condition()
+        self.seq = 0
+        self.pending = {}
+        self.dirty = OrderedDict()
+        self.busy = False
+        self.done = queue.Queue()
+        self.pipe = None
+        if loop is not None:
+            self.pipe = loop.watch_pipe(self.process)
+        self.thread = threading.Thread(target=self.run, name='data-writer', daemon=True)
+        self.thread.start()
+
+    def pending_value(self, key):
+        with self.lock:
+            _, op, value = self.pending[key]
+        return str(value) if op == 'put' else None
+
+    def changes(self, hashkey):
+        with self.lock:
+            return {
+                key[1]: (op, value) for key, (_, op, value) in self.pending.items()
+                if key[0] == hashkey
+            }
+
+    def overlay(self, hashkey, rows, changes=None, in_range=None, reverse=False):
+        if changes is None:
+            changes = self.changes(hashkey)
+        if not changes:
+            return rows
+        merged = {row[1]: row for row in rows}
+        for sortkey, (op, value) in changes.items():
+            if in_range is not None and not in_range(sortkey):
+                continue
+            if op == 'put':
+                merged[sortkey] = (hashkey, sortkey, str(value))
+            else:
+                merged.pop(sortkey, None)
+        return tuple(merged[sortkey] for sortkey in sorted(merged, reverse=reverse))
+
+    def write(self, op, key, value, callback=None):
+        with self.lock:
+            self.seq += 1
+            self.pending[key] = (self.seq, op, value)
+            callbacks = self.dirty.pop(key, (None, None, None, []))[3]
+            if callback is not None:
+                callbacks.append(callback)
+            self.dirty[key] = (self.seq, op, value, callbacks)
+            self.lock.notify_all()
+
+    def run(self):
+        data = None
+        while True:
+            with self.lock:
+                while not self.dirty:
+                    self.lock.wait()
+                writes, self.dirty = self.dirty, OrderedDict()
+                self.busy = True
+
+            # Whatever fails, including opening the connection, is handed
+            # to the callbacks; the thread has to live on for flush().
+            error = None
+            try:
+                if data is None:
+                    data = Data(self.data.dbpath, wal=self.data.wal, cache_size=0, collection_cache_size=0)
+                with data.batch():
+                    for key, (_, op, value, _) in writes.items():
+                        data.store(op, key, value, self.data.write_hooks.get(key[0]))
+            except Exception as exc:
+                logging.exception('failed to write %d keys', len(writes))
+                error = exc
+
+            self.done.put((writes, error))
+            with self.lock:
+                self.busy = False
+                self.lock.notify_all()
+            if self.pipe is not None:
+                os.write(self.pipe, b'.')
+
+    def process(self, _=None):
+        """Run in the main thread: forget committed writes, and report
+        them to their callbacks."""
+        while True:
+            try:
+                writes, error = self.done.get_nowait()
+            except queue.Empty:
+                return True
+            for key, (seq, _, _, callbacks) in writes.items():
+                with self.lock:
+                    if self.pending.get(key, (None, ))[0] == seq:
+                        del self.pending[key]
+                self.data._invalidate(*key)
+                for callback in callbacks:
+                    callback(error)
+
+    def flush(self):
+        with self.lock:
+            while self.dirty or self.busy:
+                self.lock.wait()
+        self.process()
@@ -0,0 +1,65 @@
+import bisect
+
+class Favorites:
+    """The favorite events of one conference, ordered like their sortkeys
+    ('<date>_<start>_<id>') and held in memory once loaded."""
+    def __init__(self, store, conference):
+        self.store = store
+        self.hashkey = '%s_favorite' % conference
+        self._sortkeys = {}
+        self._order = []
+        for _, sortkey, fosdem_id in store.data.get_collection(self.hashkey):
+            self._sortkeys[fosdem_id] = sortkey
+            self._order.append((sortkey, fosdem_id))
+
+    @staticmethod
+    def sortkey(event):
+        return '%s_%s_%s' % (event.date, event.start_time, event.fosdem_id)
+
+    def __contains__(self, fosdem_id):
+        return fosdem_id in self._sortkeys
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        for _, fosdem_id in self._order:
+            yield fosdem_id
+
+    def add(self, event, callback=None):
+        if event.fosdem_id in self._sortkeys:
+            if callback is not None:
+                callback(None)
+            return
+        sortkey = self.sortkey(event)
+        self._sortkeys[event.fosdem_id] = sortkey
+        bisect.insort(self._order, (sortkey, event.fosdem_id))
+        self.store.data.set_value(self.hashkey, sortkey, event.fosdem_id, callback)
+
+    def remove(self, event, callback=None):
+        sortkey = self._sortkeys.pop(event.fosdem_id, None)
+        if sortkey is None:
+            if callback is not None:
+                callback(None)
+            return
+        del self._order[bisect.bisect_left(self._order, (sortkey, event.fosdem_id))]
+        self.store.data.delete_value(self.hashkey, sortkey, callback)
+
+class FavoritesStore:
+    """Favorites of every conference, shared between schedules.
+
+    Reads are served from memory. Writes go through Data.set_value() and
+    delete_value(), so toggling a favorite doesn't wait on sqlite once
+    the data writer is started.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.conferences = {}
+
+    def get(self, conference):
+        if conference not in self.conferences:
+            self.conferences[conference] = Favorites(self, conference)
+        return self.conferences[conference]
+
+    def flush(self):
+        self.data.flush()
@@ -1,14 +1,41 @@
 #!/usr/bin/python
+import os
 import sys
+import heapq
+import bisect
+import datetime
 from io import StringIO
-from lxml import etree
 import urwid
-import sqlite3
 from enpda.view import View
 from enpda.widgets import SelectableText
-from bs4 import BeautifulSoup
+from enpda.snapshot import ScheduleSnapshot
+from enpda.search import ScheduleSearch
+from enpda.favorites import FavoritesStore
+from enpda.conferences import ConferenceList
+from enpda import ical
+
+def intern(value):
+    return sys.intern(value) if value else value
+
+def minutes(hhmm):
+    """'HH:MM' as minutes, or None if it isn't one."""
+    try:
+        h, m = hhmm.split(':')[:2]
+        return int(h) * 60 + int(m)
+    except (AttributeError, ValueError):
+        return None
+
+def html_to_text(description, abstract=None):
+    d = description or abstract
+    if not d:
+        return 'no description given'
+    # bs4 pulls in lxml and friends; only pay for that when needed.
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(d, 'lxml').get_text()
 
 class FosdemAuthor:
+    __slots__ = ('fosdem_id', 'name')
+
     def __init__(self, name, fosdem_id):
         self.fosdem_id = fosdem_id
         self.name = name
@@ -17,6 +44,8 @@ class FosdemAuthor:
         return self.name
 
 class FosdemAuthors:
+    __slots__ = ('authors', )
+
     def __init__(self, authors):
         self.authors = authors
 
@@ -24,8 +53,18 @@ class FosdemAuthors:
         return ', '.join(map(str, self.authors))
 
 class FosdemEvent:
+    """A scheduled event.
+
+    The (often large) description and abstract HTML isn't kept on the
+    event, it's looked up through the schedule when asked for.
+    """
+    __slots__ = (
+        'title', 'authors', 'track', 'room', 'date', 'duration',
+        'start_time', 'fosdem_id', 'schedule', '_text', 'start', 'end',
+    )
+
     def __init__(self, title, authors, track, room, date, duration, start_time,
-                 description, abstract, fosdem_id):
+                 fosdem_id, schedule):
         self.title = title
         self.authors = authors
         self.track = track
@@ -33,95 +72,477 @@ class FosdemEvent:
         self.date = date
         self.duration = duration
         self.start_time = start_time
-        self._description = description
-        self._abstract = abstract
         self.fosdem_id = fosdem_id
+        self.schedule = schedule
+        self._text = None
+        self.start = minutes(start_time)
+        self.end = None
+        if self.start is not None:
+            self.end = self.start + (minutes(duration) or 0)
+
+    compared = ('title', 'track', 'room', 'date', 'duration', 'start_time')
+
+    def differs(self, other, texts=None):
+        """Whether other has different details; texts stands in for this
+        event's (description, abstract) if given."""
+        if texts is None:
+            texts = self.texts
+        return any(getattr(self, k) != getattr(other, k) for k in self.compared) or \
+            str(self.authors) != str(other.authors) or \
+            tuple(texts) != tuple(other.texts)
+
+    def update_from(self, other):
+        for k in self.compared + ('authors', 'start', 'end'):
+            setattr(self, k, getattr(other, k))
+        self._text = None
+
+    @property
+    def texts(self):
+        """The raw (description, abstract) pair."""
+        return self.schedule.get_texts(self.fosdem_id)
 
     @property
     def description(self):
-        d = None
-        if self._description:
-            d = self._description
-        elif self._abstract:
-            d = self._abstract
-        if not d:
-            return 'no description given'
-        return BeautifulSoup(d, 'lxml').get_text()
+        if self._text is None:
+            self._text = self.schedule.get_text(self.fosdem_id)
+        return self._text
 
     def __str__(self):
         return '%s - %s\n        by %s (duration: %s)' % (
             self.start_time, self.title, self.authors, self.duration
         )
 
+class FosdemTimes:
+    """Events of each day by room, sorted on start time, for finding
+    what's on at a given time."""
+    def __init__(self, events):
+        self.days = {}
+        for ev in events:
+            if ev.start is not None:
+                self.days.setdefault(ev.date, {}).setdefault(ev.room, []).append(ev)
+        for rooms in self.days.values():
+            for room, events in rooms.items():
+                events.sort(key=lambda ev: ev.start)
+                rooms[room] = ([ev.start for ev in events], events)
+
+    def now_next(self, date, minute):
+        """Per room, the event running at minute (if any) and the one
+        after it."""
+        result = []
+        for room, (starts, events) in sorted(self.days.get(date, {}).items()):
+            i = bisect.bisect_right(starts, minute)
+            if i and events[i-1].end > minute:
+                result.append(events[i-1])
+            if i < len(events):
+                result.append(events[i])
+        return result
+
+    @staticmethod
+    def clashes(events):
+        """The events that overlap some other event in events."""
+        clashing = {}
+        ordered = sorted(
+            (ev for ev in events if ev.start is not None),
+            key=lambda ev: (ev.date, ev.start),
+        )
+        active = []
+        date = None
+        for ev in ordered:
+            if ev.date != date:
+                date, active = ev.date, []
+            while active and active[0][0] <= ev.start:
+                heapq.heappop(active)
+            if active:
+                clashing[ev.fosdem_id] = ev
+                for _, _, other in active:
+                    clashing[other.fosdem_id] = other
+            heapq.heappush(active, (ev.end, ev.fosdem_id, ev))
+        return sorted(clashing.values(), key=lambda ev: (ev.date, ev.start))
+
+class FosdemDiff:
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self):
+        return 'schedule updated: %d added, %d removed, %d changed' % (
+            len(self.added), len(self.removed), len(self.changed)
+        )
+
 class Fosdem:
+    special_tracks = ['Favorites', 'Now', 'Clashes']
+
     @staticmethod
-    def from_file(filename, *args, **kwargs):
-        with open(filename) as fh:
-            return Fosdem(fh, *args, **kwargs)
+    def from_file(filename, db, *args, cache=True, **kwargs):
+        snapshot = None
+        if cache:
+            snapshot = ScheduleSnapshot(db.cache_path('fosdem'), filename)
+            fosdem = Fosdem(None, db, *args, **kwargs)
+            if snapshot.load(fosdem):
+                fosdem.set_source(filename, snapshot.hash)
+                return fosdem
+        if filename.endswith('.ics'):
+            kwargs.setdefault('format', 'ical')
+        with open(filename, 'rb') as fh:
+            fosdem = Fosdem(fh, db, *args, **kwargs)
+        if snapshot is not None:
+            snapshot.save(fosdem)
+            fosdem.set_text_source(snapshot)
+            fosdem.set_source(filename, snapshot.hash)
+        else:
+            fosdem.set_source(filename)
+        return fosdem
 
-    def __init__(self, fh, db):
+    def __init__(self, fh, db, key='fosdem2020', favorites=None, format='xml'):
         self._by_tracks = {'Favorites': []}
         self._by_id = {}
         self.tracks = []
         self.trackinfo = {}
+        self.tracks_by_day = {}
         self.days = []
         self.db = db
-
-        def authors(ev):
-            authors = []
-            for p in ev.xpath('./persons/person'):
-                authors.append(FosdemAuthor(p.text, p.get('id')))
-            return FosdemAuthors(authors)
-
-        def attr(ev, key):
-            return ev.xpath('./%s' % key)[0].text
-
-        tree = etree.parse(fh)
-        days = tree.xpath('/schedule/day')
-        for day in days:
-            dayidx = int(day.get('index'))
-            date = day.get('date')
-            events = day.xpath('./room/event')
-            self.days.append('Day %d' % dayidx)
-
-            for ev in events:
-                track = 'Day %d: %s' % (dayidx, attr(ev, 'track'))
-                room = attr(ev, 'room')
-
-                if not track in self.tracks:
-                    self.tracks.append(track)
-                    self.trackinfo[track] = {
-                        'day': day,
-                        'date': date,
-                        'room': room,
-                    }
-
-                self._by_tracks.setdefault(track, [])
-                fosdemev = FosdemEvent(
-                    fosdem_id=ev.get('id'),
-                    title=attr(ev, 'title'),
-                    authors=authors(ev),
+        self.key = key
+        self._favorites = None
+        self.favorite_store = favorites
+        if favorites is None and db is not None:
+            self.favorite_store = FavoritesStore(db)
+        self._people = {}
+        self._by_person = {}
+        self._texts = {}
+        self.text_source = None
+        self.precompute_workers = None
+        self.source = None
+        self.version = None
+        self.stamp = None
+        self._times = None
+
+        if fh is not None:
+            if format == 'ical':
+                self.parse_ical(fh)
+            else:
+                self.parse(fh)
+
+    def parse(self, fh):
+        """Build the model from a schedule XML in one streaming pass,
+        dropping every <event> once it's been turned into a FosdemEvent."""
+        from lxml import etree
+
+        dayidx = date = None
+        for action, el in etree.iterparse(fh, events=('start', 'end'), tag=('day', 'event')):
+            if action == 'start':
+                if el.tag == 'day':
+                    dayidx = int(el.get('index'))
+                    date = el.get('date')
+                    self.add_day(dayidx)
+                continue
+
+            if el.tag == 'event':
+                attrs = {'persons': []}
+                for child in el:
+                    if child.tag == 'persons':
+                        attrs['persons'] = [(p.text, p.get('id')) for p in child]
+                    else:
+                        attrs[child.tag] = child.text
+
+                track = 'Day %d: %s' % (dayidx, attrs.get('track'))
+                room = attrs.get('room')
+                self.add_track(track, dayidx, date, room)
+                self.add_event(
+                    date=date,
+                    fosdem_id=el.get('id'),
+                    title=attrs.get('title'),
+                    authors=attrs['persons'],
                     track=track,
                     room=room,
-                    date=date,
-                    duration=attr(ev, 'duration'),
-                    start_time=attr(ev, 'start'),
-                    description=attr(ev, 'description'),
-                    abstract=attr(ev, 'abstract'),
+                    duration=attrs.get('duration'),
+                    start_time=attrs.get('start'),
+                    description=attrs.get('description'),
+                    abstract=attrs.get('abstract'),
                 )
-                self._by_tracks[track].append(fosdemev)
-                self._by_id[fosdemev.fosdem_id] = fosdemev
+
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+
+    def parse_ical(self, fh):
+        """Build the model from an iCalendar feed, read one VEVENT at a
+        time. Days are numbered by date, CATEGORIES gives the track and
+        ATTENDEE/ORGANIZER common names the authors. Times are taken as
+        written, without timezone conversion."""
+        records = []
+        for vevent in ical.vevents(fh):
+            try:
+                start = ical.parse_datetime(vevent['DTSTART'])
+                if 'DTEND' in vevent:
+                    duration = ical.parse_datetime(vevent['DTEND']) - start
+                else:
+                    duration = ical.parse_duration(vevent.get('DURATION', 'PT0S'))
+            except (KeyError, ValueError):
+                continue
+            minutes = int(duration.total_seconds()) // 60
+            authors = [
+                (params.get('CN') or ical.unescape(value), value)
+                for name in ['ORGANIZER', 'ATTENDEE']
+                for params, value in vevent['_all'].get(name, [])
+            ]
+            records.append((start, dict(
+                date=start.strftime('%Y-%m-%d'),
+                fosdem_id=ical.unescape(vevent.get('UID', '')) or None,
+                title=ical.unescape(vevent.get('SUMMARY', '')),
+                authors=authors,
+                track=ical.split_list(vevent.get('CATEGORIES', ''))[0] or 'Other',
+                room=ical.unescape(vevent.get('LOCATION', '')),
+                duration='%02d:%02d' % (minutes // 60, minutes % 60),
+                start_time=start.strftime('%H:%M'),
+                description=ical.unescape(vevent.get('DESCRIPTION', '')) or None,
+            )))
+
+        records.sort(key=lambda record: record[0])
+        days = {}
+        for n, (_, attrs) in enumerate(records):
+            if attrs['date'] not in days:
+                days[attrs['date']] = len(days) + 1
+                self.add_day(days[attrs['date']])
+            if attrs['fosdem_id'] is None:
+                attrs['fosdem_id'] = 'ical-%d' % n
+            dayidx = days[attrs['date']]
+            attrs['track'] = 'Day %d: %s' % (dayidx, attrs['track'])
+            self.add_track(attrs['track'], dayidx, attrs['date'], attrs['room'])
+            self.add_event(**attrs)
+
+    def add_day(self, dayidx):
+        self.days.append('Day %d' % dayidx)
+
+    def add_track(self, track, dayidx, date, room):
+        if track not in self.trackinfo:
+            track = intern(track)
+            self.tracks.append(track)
+            self.tracks_by_day.setdefault('Day %d' % dayidx, []).append(track)
+            self.trackinfo[track] = {
+                'day': dayidx,
+                'date': intern(date),
+                'room': intern(room),
+            }
+            self._by_tracks.setdefault(track, [])
+
+    def person(self, name, fosdem_id):
+        if fosdem_id is None:
+            return FosdemAuthor(name, fosdem_id)
+        try:
+            return self._people[fosdem_id]
+        except KeyError:
+            author = self._people[fosdem_id] = FosdemAuthor(name, fosdem_id)
+            return author
+
+    def add_event(self, date, fosdem_id, title, authors, track, room,
+                  duration, start_time, description=None, abstract=None):
+        """Add an event to an already added track; authors is a list of
+        (name, person id) pairs. Without a text source, description and
+        abstract are kept in memory until one is set."""
+        fosdemev = FosdemEvent(
+            fosdem_id=fosdem_id,
+            title=title,
+            authors=FosdemAuthors(tuple(self.person(*a) for a in authors)),
+            track=intern(track),
+            room=intern(room),
+            date=intern(date),
+            duration=intern(duration),
+            start_time=intern(start_time),
+            schedule=self,
+        )
+        for author in fosdemev.authors.authors:
+            self._by_person.setdefault(author.fosdem_id or author.name, []).append(fosdem_id)
+        if description or abstract:
+            self._texts[fosdem_id] = (description, abstract)
+        self._by_tracks[track].append(fosdemev)
+        self._by_id[fosdemev.fosdem_id] = fosdemev
+        self._times = None
+        return fosdemev
+
+    def set_source(self, filename, version=None):
+        """Record where the schedule came from; version is a hash of its
+        content, if known."""
+        self.source = os.path.abspath(filename)
+        self.version = version
+        st = os.stat(self.source)
+        self.stamp = (st.st_mtime_ns, st.st_size)
+
+    def changed_on_disk(self):
+        if self.source is None:
+            return False
+        try:
+            st = os.stat(self.source)
+        except OSError:
+            return False
+        return (st.st_mtime_ns, st.st_size) != self.stamp
+
+    def refresh(self):
+        """Reload the schedule from its source and patch this model to
+        match; returns a FosdemDiff. Events are matched by id, and the
+        existing objects of changed events are updated in place."""
+        # Loading the new schedule replaces the snapshot file the current
+        # texts are read from, so they have to be read before.
+        texts = self.all_texts()
+        new = Fosdem.from_file(self.source, self.db, key=self.key, favorites=self.favorite_store)
+        added, changed = [], []
+        for ev in new.events:
+            old = self._by_id.get(ev.fosdem_id)
+            if old is None:
+                ev.schedule = self
+                added.append(ev)
+            elif old.differs(ev, texts.get(ev.fosdem_id, (None, None))):
+                # The favorite's sortkey has the date and start time in it.
+                favorite = self.is_favorite(old)
+                if favorite:
+                    self.remove_favorite(old)
+                old.update_from(ev)
+                if favorite:
+                    self.add_favorite(old)
+                changed.append(old)
+        removed = [ev for fosdem_id, ev in self._by_id.items() if fosdem_id not in new._by_id]
+
+        by_id = {
+            fosdem_id: self._by_id.get(fosdem_id, ev) for fosdem_id, ev in new._by_id.items()
+        }
+        self._by_id.clear()
+        self._by_id.update(by_id)
+        self._by_tracks.clear()
+        self._by_tracks['Favorites'] = []
+        for track in new.tracks:
+            self._by_tracks[track] = [by_id[ev.fosdem_id] for ev in new._by_tracks[track]]
+        self.tracks[:] = new.tracks
+        self.trackinfo.clear()
+        self.trackinfo.update(new.trackinfo)
+        self.tracks_by_day.clear()
+        self.tracks_by_day.update(new.tracks_by_day)
+        self.days[:] = new.days
+        self._people = new._people
+        self._by_person = new._by_person
+        if self.text_source is not None and self.text_source is not new.text_source:
+            self.text_source.close()
+        if self.text_source is not new.text_source and self.precompute_workers:
+            new.precompute_texts(self.precompute_workers)
+        self.text_source = new.text_source
+        self._texts = new._texts
+        # Plain texts memoized from the old snapshot may be stale.
+        for ev in by_id.values():
+            ev._text = None
+        self.version = new.version
+        self.stamp = new.stamp
+        self._times = None
+        return FosdemDiff(added, removed, changed)
+
+    def set_text_source(self, source):
+        """Look up descriptions through source.get_texts(fosdem_id) from
+        now on, and let go of the ones held in memory."""
+        self.text_source = source
+        self._texts = {}
+
+    def get_text(self, fosdem_id):
+        """The description as plain text, converted at most once per
+        schedule snapshot."""
+        text = None
+        if self.text_source is not None:
+            text = self.text_source.get_text(fosdem_id)
+        if text is None:
+            text = html_to_text(*self.get_texts(fosdem_id))
+            if self.text_source is not None:
+                self.text_source.set_text(fosdem_id, text)
+        return text
+
+    def text_size(self):
+        """Characters of event text this schedule holds, or will once the
+        descriptions have been looked at."""
+        if self.text_source is not None:
+            return self.text_source.text_size()
+        return sum(len(text or '') for texts in self._texts.values() for text in texts)
+
+    def close(self):
+        if self.text_source is not None:
+            self.text_source.close()
+
+    def precompute_texts(self, workers=2):
+        """Convert the descriptions to plain text in the background, now
+        and again for each new snapshot refresh() switches to."""
+        self.precompute_workers = workers
+        if self.text_source is not None:
+            return self.text_source.precompute_texts(html_to_text, workers)
+
+    def all_texts(self):
+        """(description, abstract) of every event that has them, by id."""
+        if self.text_source is not None:
+            return self.text_source.all_texts()
+        return dict(self._texts)
+
+    def get_texts(self, fosdem_id):
+        try:
+            return self._texts[fosdem_id]
+        except KeyError:
+            pass
+        if self.text_source is not None:
+            return self.text_source.get_texts(fosdem_id)
+        return None, None
+
+    @property
+    def events(self):
+        for track in self.tracks:
+            yield from self._by_tracks[track]
+
+    @property
+    def favorite_set(self):
+        if self._favorites is None:
+            self._favorites = self.favorite_store.get(self.key)
+        return self._favorites
 
     @property
     def favorites(self):
         return [
-            self.get_event(ev[2])
-            for ev in self.db.get_collection('fosdem2020_favorite')
+            self._by_id[fosdem_id]
+            for fosdem_id in self.favorite_set
+            if fosdem_id in self._by_id
         ]
 
+    def is_favorite(self, event):
+        return self.favorite_store is not None and event.fosdem_id in self.favorite_set
+
+    def add_favorite(self, event, callback=None):
+        self.favorite_set.add(event, callback)
+
+    def remove_favorite(self, event, callback=None):
+        self.favorite_set.remove(event, callback)
+
+    def speaker_events(self, author):
+        """Every event by author, in time order."""
+        return sorted(
+            (self._by_id[fosdem_id] for fosdem_id in
+             self._by_person.get(author.fosdem_id or author.name, [])),
+            key=lambda ev: (ev.date, ev.start_time or ''),
+        )
+
+    @property
+    def times(self):
+        if self._times is None:
+            self._times = FosdemTimes(self.events)
+        return self._times
+
+    def now_next(self, now=None):
+        now = now or datetime.datetime.now()
+        return self.times.now_next(now.strftime('%Y-%m-%d'), now.hour * 60 + now.minute)
+
     def get_track(self, track):
         if track == 'Favorites':
             return self.favorites, {'date': '?', 'day': '?', 'room': 'ulb'}
+        if track == 'Now':
+            now = datetime.datetime.now()
+            return self.now_next(now), {
+                'date': now.strftime('%Y-%m-%d %H:%M'), 'day': '?', 'room': 'any',
+            }
+        if track == 'Clashes':
+            return self.times.clashes(self.favorites), {'date': '?', 'day': '?', 'room': 'any'}
         return self._by_tracks[track], self.trackinfo[track]
 
     def get_event(self, fosdem_id):
@@ -131,17 +552,21 @@ class Fosdem:
 class FosdemList(urwid.ListBox):
     def __init__(self, view, items):
         self.view = view
-        self.list = items
+        self._widgets = {}
         self.w = urwid.SimpleFocusListWalker([])
-        self.filter()
+        self.show(items)
         super().__init__(self.w)
 
-    def filter(self, cb=None):
-        if cb is None:
-            cb = lambda _: True
-        self.w.clear()
-        for item in [i for i in self.list if cb(i) or i == 'Favorites']:
-            self.w.append(SelectableText(item))
+    def widget(self, item):
+        try:
+            return self._widgets[item]
+        except KeyError:
+            w = self._widgets[item] = SelectableText(item)
+            return w
+
+    def show(self, items):
+        """List items, reusing the widget made the last time each was shown."""
+        self.w[:] = [self.widget(item) for item in items]
 
     def keypress(self, size, key):
         if self.focus_position == 0 and key in ['k', 'up']:
@@ -164,10 +589,7 @@ class FosdemTrackListControl(urwid.Columns):
 
     def keypress(self, size, key):
         if key == 'enter':
-            if self.focus.text.startswith('Day '):
-                self.tracklist.filter(lambda line: line.startswith(self.focus.text))
-            else:
-                self.tracklist.filter()
+            self.tracklist.filter_day(self.focus.text)
             return
         if key == 'j' or key == 'down':
             self.tracklist.focus_position = 'body'
@@ -177,7 +599,8 @@ class FosdemTrackListControl(urwid.Columns):
 class FosdemTrackList(urwid.Frame):
     def __init__(self, view, fosdem):
         self.fosdem = fosdem
-        self.list = FosdemList(view, ['Favorites'] + fosdem.tracks)
+        self.day = None
+        self.list = FosdemList(view, Fosdem.special_tracks + fosdem.tracks)
         self.ctrl = FosdemTrackListControl(self, fosdem)
 
         super().__init__(
@@ -192,8 +615,14 @@ class FosdemTrackList(urwid.Frame):
         else:
             self.focus_position = 'body'
 
-    def filter(self, cb=None):
-        self.list.filter(cb)
+    def filter_day(self, day):
+        """Show the tracks of day, or of all days if it isn't one."""
+        self.day = day
+        tracks = self.fosdem.tracks_by_day.get(day, self.fosdem.tracks)
+        self.list.show(Fosdem.special_tracks + tracks)
+
+    def refresh(self):
+        self.filter_day(self.day)
 
     def keypress(self, size, key):
         if key == 'tab':
@@ -207,7 +636,15 @@ class FosdemTrackList(urwid.Frame):
 class FosdemEventText(SelectableText):
     def __init__(self, ev):
         self.ev = ev
-        super().__init__(str(ev))
+        super().__init__(self.markup())
+
+    def markup(self):
+        if self.ev.schedule.is_favorite(self.ev):
+            return [('favorite', '*'), ' %s' % self.ev]
+        return '  %s' % self.ev
+
+    def refresh(self):
+        self.set_text(self.markup())
 
     @property
     def fosdem_id(self):
@@ -216,6 +653,9 @@ class FosdemEventText(SelectableText):
 class FosdemEventList(urwid.Frame):
     def __init__(self, view, *args, track=None, **kwargs):
         self.view = view
+        self.track = track
+        self.speaker = None
+        self._rows = {}
         self.list = FosdemList(view, *args, **kwargs)
         self.footer = urwid.Text('', 'right')
         self.header = urwid.Text(
@@ -233,14 +673,64 @@ class FosdemEventList(urwid.Frame):
         track_title = 'Track: %s (%s) in room %s' % (
             track, info['date'], info['room']
         )
+        self.show_events(track_title, events)
+        self.track = track
 
+    def show_events(self, title, events):
+        self.track = None
+        self.speaker = None
         if events:
-            self.header.set_text(('subheader', '%s' % track_title))
+            self.header.set_text(('subheader', '%s' % title))
         else:
-            self.header.set_text(('subheader', '%s (no events listed)' % track_title))
+            self.header.set_text(('subheader', '%s (no events listed)' % title))
+
+        self.list.w[:] = [self.row(ev) for ev in events]
+
+    def row(self, ev):
+        w = self._rows.get(ev.fosdem_id)
+        if w is None or w.ev is not ev:
+            w = self._rows[ev.fosdem_id] = FosdemEventText(ev)
+        return w
 
-        self.list.w.clear()
-        self.list.w.extend([FosdemEventText(ev) for ev in events])
+    def show_speaker(self, ev):
+        """List the talks of the event's first speaker, or of the next
+        one if that is who's listed already."""
+        authors = ev.authors.authors
+        if not authors:
+            return
+        i = 0
+        if self.speaker in authors:
+            i = (authors.index(self.speaker) + 1) % len(authors)
+        speaker = authors[i]
+        self.show_events('Speaker: %s' % speaker, self.view.fosdem.speaker_events(speaker))
+        self.speaker = speaker
+
+    def refresh(self, diff):
+        """Bring the listed events up to date after the schedule changed."""
+        for ev in diff.removed:
+            self._rows.pop(ev.fosdem_id, None)
+        if self.track is not None:
+            if self.track in Fosdem.special_tracks or self.track in self.view.fosdem.trackinfo:
+                self.view.update_track(self.track)
+            else:
+                self.show_events('Track: %s' % self.track, [])
+        else:
+            removed = {ev.fosdem_id for ev in diff.removed}
+            self.list.w[:] = [w for w in self.list.w if w.fosdem_id not in removed]
+        for ev in diff.changed:
+            if ev.fosdem_id in self._rows:
+                self._rows[ev.fosdem_id].refresh()
+        self.footer.set_text(('success', str(diff)))
+
+    def written(self, message):
+        """A write callback confirming message in the footer once the
+        write is stored."""
+        def callback(error):
+            if error is None:
+                self.footer.set_text(('success', message))
+            else:
+                self.footer.set_text(('error', '%s failed: %s' % (message, error)))
+        return callback
 
     def keypress(self, size, key):
         target = self.list.focus
@@ -248,16 +738,21 @@ class FosdemEventList(urwid.Frame):
         if target.keypress(size, key) is None:
             return
         if key == 'f':
-            self.view.add_favorite(target.ev)
-            self.footer.set_text(('success', 'added favorite'))
+            self.footer.set_text('adding favorite')
+            self.view.add_favorite(target.ev, self.written('added favorite'))
+            target.refresh()
             return
         if key == 'd':
-            self.view.remove_favorite(target.ev)
-            self.footer.set_text(('success', 'deleted favorite'))
+            self.footer.set_text('deleting favorite')
+            self.view.remove_favorite(target.ev, self.written('deleted favorite'))
+            target.refresh()
             return
         if key == 'N':
             self.view.open_note(target.ev)
             return
+        if key == 's':
+            self.show_speaker(target.ev)
+            return
         if key == 'enter':
             self.list.view.show_event_details(target.ev)
             return
@@ -268,13 +763,96 @@ class FosdemEventList(urwid.Frame):
         return self.list.walker
 
 class FosdemView(View):
-    def __init__(self, app, fosdem, **kwargs):
-        self.fosdem_view = FosdemViewWidget(app, fosdem)
-        super().__init__(app, body=self.fosdem_view)
+    """A schedule, or with library set, a list of conferences to open
+    one from (backspace goes back to it)."""
+    poll_interval = 30
+
+    def __init__(self, app, fosdem=None, library=None, **kwargs):
+        self.fosdem = None
+        self.fosdem_view = None
+        self.library = library
+        self.search = None
+        self.search_prompt = FosdemSearchPrompt(self.on_search, self.close_search)
+        super().__init__(app, body=urwid.SolidFill())
+        if fosdem is not None:
+            self.show_conference(fosdem)
+        else:
+            self.show_library()
+        self.schedule_poll()
+
+    def schedule_poll(self):
+        if self.app.loop is not None:
+            self.app.loop.set_alarm_in(self.poll_interval, self.poll)
+
+    def poll(self, loop, user_data=None):
+        # Stop polling once the view has been replaced.
+        if self.app.contents['body'][0] is not self:
+            return
+        if self.fosdem is not None and self.fosdem.changed_on_disk():
+            self.refresh()
+        self.schedule_poll()
+
+    def refresh(self):
+        diff = self.fosdem.refresh()
+        # The prompt may be open on the search; it only needs the events
+        # whose indexed fields changed reindexing.
+        if self.search is not None:
+            self.search.update()
+        if diff:
+            self.fosdem_view.panes.refresh(diff)
+
+    def show_library(self):
+        self.fosdem = self.fosdem_view = self.search = None
+        self.body = ConferenceList(self.library, self.open_conference)
+
+    def open_conference(self, header):
+        self.show_conference(self.library.open(header))
+
+    def show_conference(self, fosdem):
+        self.fosdem = fosdem
+        self.search = None
+        self.fosdem_view = FosdemViewWidget(self.app, fosdem)
+        self.body = self.fosdem_view
+
+    def open_search(self):
+        if self.search is None:
+            self.search = ScheduleSearch(self.app.data, self.fosdem)
+        self.footer = self.search_prompt
+        self.focus_position = 'footer'
+
+    def on_search(self, text):
+        events = self.search.query(text) if text.strip() else []
+        self.fosdem_view.panes.eventlist.show_events('Search: %s' % text, events)
+
+    def close_search(self, show_results):
+        self.footer = None
+        self.focus_position = 'body'
+        if show_results and self.fosdem_view.panes.eventlist.list.w:
+            self.fosdem_view.panes.focus_position = 1
 
     def keypress(self, size, key):
+        if self.focus_position == 'footer' or self.fosdem_view is None:
+            return super().keypress(size, key)
         if self.fosdem_view.keypress(size, key) is None:
             return
+        if key == '/':
+            self.open_search()
+            return
+        if key == 'backspace' and self.library is not None:
+            self.show_library()
+            return
+        return super().keypress(size, key)
+
+class FosdemSearchPrompt(urwid.Edit):
+    def __init__(self, on_change, on_close):
+        self.on_close = on_close
+        super().__init__(caption='search: ')
+        urwid.connect_signal(self, 'change', lambda w, text: on_change(text))
+
+    def keypress(self, size, key):
+        if key in ['enter', 'esc']:
+            self.on_close(key == 'enter')
+            return
         return super().keypress(size, key)
 
 class FosdemViewWidget(urwid.WidgetPlaceholder):
@@ -282,23 +860,14 @@ class FosdemViewWidget(urwid.WidgetPlaceholder):
         self.app = app
         self.popup_open = False
         self.fosdem = fosdem
-        super().__init__(FosdemPanes(self, fosdem))
+        self.panes = FosdemPanes(self, fosdem)
+        super().__init__(self.panes)
 
-    def add_favorite(self, event):
-        sortkey = '%s_%s_%s' % (event.date, event.start_time, event.fosdem_id)
-        try:
-            self.app.data.insert('fosdem2020_favorite', sortkey, event.fosdem_id)
-        except sqlite3.IntegrityError as exc:
-            if not 'UNIQUE constraint failed' in str(exc):
-                raise
+    def add_favorite(self, event, callback=None):
+        self.fosdem.add_favorite(event, callback)
 
-    def remove_favorite(self, event):
-        sortkey = '%s_%s_%s' % (event.date, event.start_time, event.fosdem_id)
-        try:
-            self.app.data.delete('fosdem2020_favorite', sortkey)
-        except sqlite3.IntegrityError as exc:
-            if not 'UNIQUE constraint failed' in str(exc):
-                raise
+    def remove_favorite(self, event, callback=None):
+        self.fosdem.remove_favorite(event, callback)
 
     def open_note(self, event):
         self.app.change_view('notes', {
@@ -343,11 +912,15 @@ class FosdemPanes(urwid.Columns):
     def update_track(self, track, info=None):
         self.eventlist.change_track(track, *self.fosdem.get_track(track))
 
-    def add_favorite(self, event):
-        return self.view.add_favorite(event)
+    def refresh(self, diff):
+        self.tracklist.refresh()
+        self.eventlist.refresh(diff)
+
+    def add_favorite(self, event, callback=None):
+        return self.view.add_favorite(event, callback)
 
-    def remove_favorite(self, event):
-        return self.view.remove_favorite(event)
+    def remove_favorite(self, event, callback=None):
+        return self.view.remove_favorite(event, callback)
 
     def open_note(self, event):
         return self.view.open_note(event)
@@ -0,0 +1,127 @@
+import io
+import datetime
+
+def unfold(fh):
+    """Logical lines of an iCalendar stream (RFC 5545 3.1): a line
+    starting with a space or tab continues the one before it."""
+    current = None
+    for line in fh:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+def split_line(line):
+    """'NAME;P=v;Q="a:b":value' -> ('NAME', {'P': 'v', 'Q': 'a:b'}, 'value')"""
+    quoted = False
+    for i, c in enumerate(line):
+        if c == '"':
+            quoted = not quoted
+        elif c == ':' and not quoted:
+            break
+    else:
+        return line.upper(), {}, ''
+    head, value = line[:i], line[i+1:]
+    name, *params = head.split(';')
+    return name.upper(), dict(
+        (k.upper(), v.strip('"')) for k, _, v in (p.partition('=') for p in params)
+    ), value
+
+def unescape(value):
+    out = []
+    chars = iter(value)
+    for c in chars:
+        if c == '\\':
+            c = next(chars, '')
+            c = '\n' if c in 'nN' else c
+        out.append(c)
+    return ''.join(out)
+
+def split_list(value):
+    """The items of a comma separated value like CATEGORIES, unescaped;
+    an escaped comma stays within its item."""
+    items = []
+    start = 0
+    escaped = False
+    for i, c in enumerate(value):
+        if escaped:
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c == ',':
+            items.append(value[start:i])
+            start = i + 1
+    items.append(value[start:])
+    return [unescape(item) for item in items]
+
+def parse_datetime(value):
+    value = value.rstrip('Z')
+    if 'T' in value:
+        return datetime.datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+    return datetime.datetime.strptime(value[:8], '%Y%m%d')
+
+def parse_duration(value):
+    """An iCalendar DURATION like 'PT1H30M' or 'P1D' as a timedelta."""
+    sign = -1 if value.startswith('-') else 1
+    value = value.lstrip('+-').lstrip('P')
+    total = datetime.timedelta()
+    number = ''
+    in_time = False
+    units = {'W': 'weeks', 'D': 'days', 'H': 'hours', 'M': 'minutes', 'S': 'seconds'}
+    for c in value:
+        if c == 'T':
+            in_time = True
+        elif c.isdigit():
+            number += c
+        elif c in units and number:
+            if c == 'M' and not in_time:
+                raise ValueError('months in duration: %s' % value)
+            total += datetime.timedelta(**{units[c]: int(number)})
+            number = ''
+    return sign * total
+
+def vevents(fh):
+    """Yield each VEVENT of a binary iCalendar stream as a dict of its
+    properties, one at a time. Repeated properties (ATTENDEE and the
+    like) are gathered in lists of (params, value) pairs under their
+    name, the first of each is also kept in the dict."""
+    text = io.TextIOWrapper(fh, encoding='utf-8', errors='replace', newline='')
+    event = None
+    depth = 0
+    for line in unfold(text):
+        name, params, value = split_line(line)
+        if name == 'BEGIN':
+            if value.upper() == 'VEVENT' and event is None:
+                event = {'_all': {}}
+            elif event is not None:
+                depth += 1
+            continue
+        if name == 'END':
+            if event is not None:
+                if depth:
+                    depth -= 1
+                elif value.upper() == 'VEVENT':
+                    yield event
+                    event = None
+            continue
+        if event is None or depth:
+            continue
+        event['_all'].setdefault(name, []).append((params, value))
+        event.setdefault(name, value)
+
+def calendar_name(fh):
+    """X-WR-CALNAME of a binary iCalendar stream, reading no further
+    than the first VEVENT."""
+    text = io.TextIOWrapper(fh, encoding='utf-8', errors='replace', newline='')
+    for line in unfold(text):
+        name, _, value = split_line(line)
+        if name == 'X-WR-CALNAME':
+            return unescape(value)
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            return None
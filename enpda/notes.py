@@ -2,36 +2,58 @@ import urwid
 import logging
 from collections import defaultdict
 from enpda.view import View
-from enpda.widgets import SelectableText
+from enpda.widgets import SelectableText, ScanWalker
+from enpda.search import NoteSearch, TitleMatcher
+from enpda.textbuffer import BufferView
+from enpda.revisions import NoteRevisions
 
 class NoteDB:
     def __init__(self, db, hooks=None):
         self.db = db
         self.hooks = hooks or defaultdict(lambda: lambda note: None)
+        self.search = NoteSearch(db)
+        self.revisions = NoteRevisions(db)
+        self._titles = None
 
     @property
-    def list(self):
-        return [n[1] for n in self.db.get_collection('note')]
+    def titles(self):
+        if self._titles is None:
+            self._titles = TitleMatcher(self.db.scan_keys('note'))
+        return self._titles
 
     def get_value(self, title):
         return self.db.get_value('note', title)
 
     def get_note(self, title):
-        return Note(self, title, self.get_value(title))
+        return Note(self, title)
 
-    def create(self, title, content):
-        self.db.insert('note', title, content)
+    def create(self, title, content, callback=None):
+        self.db.set_value('note', title, content, callback)
+        self.revisions.add(title, content)
+        if self._titles is not None:
+            self._titles.add(title)
         self.hooks['on_create'](title)
 
-    def update(self, title, content):
-        self.db.update('note', title, content)
+    def update(self, title, content, callback=None):
+        self.db.set_value('note', title, content, callback)
+        self.revisions.add(title, content)
         self.hooks['on_update'](title)
 
+    def find(self, text, limit=100):
+        """Titles fuzzily matching text, followed by the notes whose
+        bodies contain its words."""
+        titles = self.titles.match(text, limit)
+        seen = set(titles)
+        return titles + [t for t in self.search.query(text, limit) if t not in seen]
+
 class Note:
     def __init__(self, db, title, content=None):
         self.title = title
         self.db = db
-        self.new = self.is_new()
+        # The one lookup tells both whether the note exists and what it says.
+        if content is None:
+            content = self.get_content()
+        self.new = content is None
         self._content = content
 
     def get_content(self):
@@ -50,16 +72,16 @@ class Note:
     def content(self, value):
         self.save(value)
 
-    def create(self, content):
-        self.db.create(self.title, content)
+    def create(self, content, callback=None):
+        self.db.create(self.title, content, callback)
         self.new = False
 
-    def save(self, content):
+    def save(self, content, callback=None):
         content = content or ''
         if self.new:
-            self.create(content)
+            self.create(content, callback)
         else:
-            self.db.update(self.title, content)
+            self.db.update(self.title, content, callback)
         self._content = content
 
     def flush_cache(self):
@@ -76,7 +98,8 @@ class NotesView(View):
             NoteDB(app.data, hooks={
                 'on_create': self.update_list
             }),
-            init_state
+            init_state,
+            app=app,
         )
         super().__init__(app, *args, body=self.notes, **kwargs)
 
@@ -84,8 +107,9 @@ class NotesView(View):
         self.notes.update_list(title)
 
 class NotesColumns(urwid.Columns):
-    def __init__(self, notes, init_state=()):
+    def __init__(self, notes, init_state=(), app=None):
         self.notes = notes
+        self.app = app
 
         self.note_list = NotesList(self, self.notes)
         initial_widgets = [self.note_list]
@@ -93,10 +117,10 @@ class NotesColumns(urwid.Columns):
         super().__init__(initial_widgets)
 
         if 'open' in init_state:
-            self.show_left(Editor(notes.get_note(init_state['open'])))
+            self.show_left(Editor(notes.get_note(init_state['open']), app))
 
     def update_list(self, title):
-        self.contents[0] = (NotesList(self, self.notes), self.options())
+        self.note_list.insert(title)
 
     def show_left(self, widget):
         l = len(self.contents)
@@ -106,6 +130,11 @@ class NotesColumns(urwid.Columns):
             self.contents[1] = (widget, self.options())
         self.set_focus(widget)
 
+    def close_left(self):
+        if len(self.contents) > 1:
+            del self.contents[1]
+        self.set_focus(self.note_list)
+
     def keypress(self, size, key):
         if key == 'tab':
             self.focus_position ^= 1
@@ -127,56 +156,101 @@ class NotenamePromptEdit(urwid.Edit):
             return
         return super().keypress(size, key)
 
+class NoteSearchPrompt(urwid.Filler):
+    def __init__(self, on_change, on_close):
+        super().__init__(NoteSearchPromptEdit(on_change, on_close))
+
+class NoteSearchPromptEdit(urwid.Edit):
+    def __init__(self, on_change, on_close):
+        self.on_close = on_close
+        super().__init__(caption='Search: ')
+        urwid.connect_signal(self, 'change', lambda w, text: on_change(text))
+
+    def keypress(self, size, key):
+        if key in ['enter', 'esc']:
+            self.on_close(key == 'enter')
+            return
+        return super().keypress(size, key)
+
 class NotesList(urwid.ListBox):
     def __init__(self, parent, notes):
         self.parent = parent
         self.notes = notes
-        super().__init__(
-            [SelectableText(n) for n in notes.list]
-        )
+        self.walker = ScanWalker(notes.db, 'note', SelectableText)
+        super().__init__(self.walker)
+
+    def insert(self, title):
+        self.walker.insert(title)
 
     def open_note(self, title):
-        self.parent.show_left(Editor(Note(self.notes, title)))
+        self.parent.show_left(Editor(Note(self.notes, title), self.parent.app))
+
+    def open_search(self):
+        self.parent.show_left(NoteSearchPrompt(self.on_search, self.close_search))
+
+    def on_search(self, text):
+        if not text:
+            self.body = self.walker
+            return
+        self.body = urwid.SimpleFocusListWalker(
+            [SelectableText(title) for title in self.notes.find(text)]
+        )
+
+    def close_search(self, show_results):
+        if not show_results:
+            self.body = self.walker
+        self.parent.close_left()
 
     def new_note(self, title):
         self.open_note(title)
 
     def keypress(self, size, key):
-        if key == 'enter':
+        if key == 'enter' and self.focus is not None:
             self.open_note(self.focus.get_text()[0])
             return
         if key == 'n':
             self.parent.show_left(NotenamePrompt(self.new_note))
             return
+        if key == '/':
+            self.open_search()
+            return
+        if key == 'esc' and self.body is not self.walker:
+            self.body = self.walker
+            return
         return super().keypress(size, key)
 
 class EditorPrompt(urwid.Edit):
     def __init__(self):
         super().__init__(caption='')
 
-class Buffer(urwid.Filler):
-    def __init__(self, content):
-        super().__init__(BufferEdit(content), 'top')
-
-    @property
-    def edit_text(self):
-        return self.body.edit_text
-
-class BufferEdit(urwid.Edit):
-    def __init__(self, content):
-        super().__init__(edit_text=content or '', multiline=True)
+def spans(numbers):
+    """Sorted numbers as '0, 16, 32-40'."""
+    parts = []
+    start = None
+    for i, n in enumerate(numbers):
+        if start is None:
+            start = n
+        if i + 1 == len(numbers) or numbers[i + 1] != n + 1:
+            parts.append(str(n) if start == n else '%d-%d' % (start, n))
+            start = None
+    return ', '.join(parts)
 
 class Editor(urwid.Frame):
-    def __init__(self, note):
+    autosave_delay = 2
+
+    def __init__(self, note, app=None):
         self.note = note
+        self.app = app
         self._mode = 'normal'
+        self._autosave = None
         self.keypress_map = {
             'cmd': self.keypress_cmd,
             'normal': self.keypress_normal,
             'insert': self.keypress_insert,
         }
         self.prompt = EditorPrompt()
-        self.buffer = Buffer(note.content)
+        self.buffer = BufferView(note.content)
+        self.saved_version = self.buffer.version
 
         super().__init__(
             header=urwid.AttrMap(urwid.Text(note.title), 'header'),
@@ -204,23 +278,7 @@ class Editor(urwid.Frame):
         self._mode = mode
 
     def keypress_movement(self, size, key):
-        # TODO: $, b, w, G, gg
-        coords = self.buffer.get_cursor_coords(size)
-        if key == 'h':
-            coords = (coords[0]-1, coords[1])
-        if key == 'k':
-            coords = (coords[0], coords[1]-1)
-        if key == 'j':
-            coords = (coords[0], coords[1]+1)
-        if key == 'l':
-            coords = (coords[0]+1, coords[1])
-        if key == 'g':
-            coords = (coords[0], 0)
-        if key == '^':
-            coords = (0, coords[1])
-        if key == '$':
-            coords = (0, coords[1])
-        self.buffer.move_cursor_to_coords(size, *coords)
+        self.buffer.move(key)
 
     def keypress_normal(self, size, key):
         if key == 'i':
@@ -235,35 +293,86 @@ class Editor(urwid.Frame):
     def cmd_set(self, *args):
         pass
 
+    def save(self):
+        self.saved_version = self.buffer.version
+        self.note.save(self.buffer.edit_text, self.on_written)
+
+    def schedule_autosave(self):
+        """Save once no key has been typed for autosave_delay seconds."""
+        loop = self.app.loop if self.app is not None else None
+        if loop is None:
+            return
+        if self._autosave is not None:
+            loop.remove_alarm(self._autosave)
+        self._autosave = loop.set_alarm_in(self.autosave_delay, self.autosave)
+
+    def autosave(self, loop=None, user_data=None):
+        self._autosave = None
+        if self.buffer.version != self.saved_version:
+            self.save()
+
     def cmd_w(self, *args):
-        self.note.save(self.buffer.edit_text)
+        self.save()
+
+    def cmd_rev(self, *args):
+        """List the stored revisions, or load one into the buffer."""
+        revisions = self.note.db.revisions
+        if not args:
+            available = revisions.revisions(self.note.title)
+            self.prompt.set_caption('%d revisions%s' % (
+                len(available), ': %s' % spans(available) if available else ''
+            ))
+            return
+        try:
+            text = revisions.get(self.note.title, int(args[0]))
+        except (KeyError, ValueError):
+            self.prompt.set_caption('no revision %s' % args[0])
+            return
+        self.buffer = BufferView(text)
+        self.saved_version = None
+        self.body = self.buffer
+        self.prompt.set_caption('revision %s, :w to keep it' % args[0])
+
+    def on_written(self, error):
+        if self.mode != 'normal':
+            return
+        if error is None:
+            self.prompt.set_caption('"%s" written' % self.note.title)
+        else:
+            self.prompt.set_caption('"%s" not written: %s' % (self.note.title, error))
 
     def cmd_execute(self, cmd, *args):
         try:
             {
                 'w': self.cmd_w,
+                'rev': self.cmd_rev,
                 'set': self.cmd_set,
             }[cmd](*args)
         except KeyError:
             pass
 
     def keypress_cmd(self, size, key):
-        if key == 'enter':
-            text = self.prompt.edit_text
-            if text:
-                self.cmd_execute(*text.split())
-
         if key in ['esc', 'enter']:
+            text = self.prompt.edit_text
             self.prompt.edit_text = ''
             self.mode = 'normal'
+            if key == 'enter' and text:
+                self.cmd_execute(*text.split())
         else:
             return super().keypress(size, key)
 
     def keypress_insert(self, size, key):
         if key == 'esc':
             self.mode = 'normal'
-        else:
-            return super().keypress(size, key)
+            # Don't leave the last edits to an alarm that quitting drops.
+            if self._autosave is not None:
+                self.app.loop.remove_alarm(self._autosave)
+            self.autosave()
+            return
+        key = super().keypress(size, key)
+        if self.buffer.version != self.saved_version:
+            self.schedule_autosave()
+        return key
 
     def keypress(self, size, key):
         if self.mode == 'normal':
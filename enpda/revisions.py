@@ -0,0 +1,188 @@
+import json
+import difflib
+import logging
+import threading
+from enpda.data import Data
+
+def line_delta(old, new):
+    """Operations turning the lines of old into those of new: a positive
+    int copies that many lines, a negative one skips them, and a string
+    is inserted."""
+    old = old.splitlines(keepends=True)
+    new = new.splitlines(keepends=True)
+    # Trim what is unchanged at either end, which is most of a note
+    # between two saves, before handing the rest to difflib.
+    head = 0
+    while head < min(len(old), len(new)) and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < min(len(old), len(new)) - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    ops = [head] if head else []
+    matcher = difflib.SequenceMatcher(
+        None, old[head:len(old) - tail], new[head:len(new) - tail], autojunk=False,
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(''.join(new[head + j1:head + j2]))
+    if tail:
+        ops.append(tail)
+    return ops
+
+def apply_delta(old, ops):
+    old = old.splitlines(keepends=True)
+    new = []
+    pos = 0
+    for op in ops:
+        if isinstance(op, str):
+            new.append(op)
+        elif op > 0:
+            new.extend(old[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return ''.join(new)
+
+class RevisionValue:
+    """The stored value of a revision: the full text with previous None,
+    else the delta against previous. It is only worked out when turned
+    into a string, which with a DataWriter happens in its thread."""
+    def __init__(self, previous, content):
+        self.previous = previous
+        self.content = content
+        self.value = None
+
+    def __str__(self):
+        if self.value is None:
+            if self.previous is None:
+                self.value = json.dumps({'full': self.content})
+            else:
+                self.value = json.dumps({'delta': line_delta(self.previous, self.content)})
+        return self.value
+
+class NoteRevisions:
+    """Revision history of notes, stored under 'note_revision:<title>'.
+
+    Every snapshot_interval-th revision holds the full text, the others
+    a line delta against the revision before. Restoring a revision thus
+    reads one snapshot and fewer than snapshot_interval deltas, however
+    long the history. Beyond the newest keep revisions, compaction drops
+    the deltas and leaves only the snapshots, in a thread of its own; one
+    asked for while another runs for the same note follows it.
+    """
+    snapshot_interval = 16
+    keep = 64
+
+    def __init__(self, data):
+        self.data = data
+        self._last = None
+        # The latest revision to compact up to, per title being compacted.
+        self._compacting = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def hashkey(title):
+        return 'note_revision:%s' % title
+
+    @staticmethod
+    def sortkey(revision):
+        return '%010d' % revision
+
+    def revisions(self, title):
+        """The revisions that can be restored: the snapshots, and the
+        deltas whose chain back to a snapshot is complete."""
+        revisions = []
+        for key in self.data.scan_keys(self.hashkey(title)):
+            revision = int(key)
+            if revision % self.snapshot_interval == 0 or \
+                    (revisions and revisions[-1] == revision - 1):
+                revisions.append(revision)
+        return revisions
+
+    def latest(self, title):
+        keys = self.data.scan_keys(self.hashkey(title), reverse=True, limit=1)
+        return int(keys[0]) if keys else None
+
+    def get(self, title, revision):
+        """The text of a revision; KeyError if it was compacted away."""
+        snapshot = revision - revision % self.snapshot_interval
+        rows = self.data.scan(
+            self.hashkey(title),
+            start=self.sortkey(snapshot), end=self.sortkey(revision + 1),
+        )
+        if len(rows) != revision - snapshot + 1:
+            raise KeyError(revision)
+        text = None
+        for _, _, value in rows:
+            value = json.loads(value)
+            text = value['full'] if 'full' in value else apply_delta(text, value['delta'])
+        return text
+
+    def add(self, title, content):
+        """Record content as the next revision, unless it is unchanged.
+        The delta is left for the write to compute."""
+        if self._last is not None and self._last[0] == title:
+            _, latest, previous = self._last
+        else:
+            latest = self.latest(title)
+            previous = None if latest is None else self.get(title, latest)
+        if latest is not None and previous == content:
+            return latest
+
+        revision = 0 if latest is None else latest + 1
+        if revision % self.snapshot_interval == 0:
+            previous = None
+        self.data.set_value(
+            self.hashkey(title), self.sortkey(revision), RevisionValue(previous, content),
+        )
+        self._last = (title, revision, content)
+
+        if revision >= self.keep + self.snapshot_interval and \
+                revision % self.snapshot_interval == 0:
+            self.compact_in_background(title, revision)
+        return revision
+
+    def compact_in_background(self, title, latest):
+        with self._lock:
+            running = title in self._compacting
+            self._compacting[title] = latest
+        if not running:
+            threading.Thread(
+                target=self.compact_queued, args=(title, ), name='revisions', daemon=True,
+            ).start()
+
+    def compact_queued(self, title):
+        """Compact title until no newer compaction has been asked for."""
+        latest = None
+        try:
+            while True:
+                with self._lock:
+                    if self._compacting[title] == latest:
+                        del self._compacting[title]
+                        return
+                    latest = self._compacting[title]
+                self.compact(title, latest)
+        except Exception:
+            logging.exception('failed to compact the revisions of %s', title)
+            with self._lock:
+                self._compacting.pop(title, None)
+
+    def compact(self, title, latest):
+        """Drop the deltas of revisions older than the newest keep,
+        through a connection of its own."""
+        data = Data(self.data.dbpath, wal=self.data.wal, cache_size=0, collection_cache_size=0)
+        try:
+            cutoff = latest - self.keep
+            cutoff -= cutoff % self.snapshot_interval
+            hashkey = self.hashkey(title)
+            with data.batch():
+                for key in data.scan_keys(hashkey, end=self.sortkey(cutoff)):
+                    if int(key) % self.snapshot_interval:
+                        data.delete(hashkey, key)
+        finally:
+            data.db.close()
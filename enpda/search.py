@@ -0,0 +1,198 @@
+import re
+import html
+import heapq
+import bisect
+import hashlib
+
+class ScheduleSearch:
+    """Full text search over a schedule, in an FTS5 table of the Data db.
+
+    Rows are scoped by the schedule's source path. The index is brought
+    up to date once per schedule version, touching only events whose
+    indexed fields changed since the last time.
+    """
+    table = 'fosdem_search'
+
+    def __init__(self, data, fosdem):
+        self.data = data
+        self.db = data.db
+        self.fosdem = fosdem
+        self.schedule = fosdem.source or ''
+        self.db.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(
+                schedule UNINDEXED, fosdem_id UNINDEXED, digest UNINDEXED,
+                title, authors, track, body,
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''' % self.table)
+        self.update()
+
+    @staticmethod
+    def strip_html(text):
+        return html.unescape(re.sub(r'<[^>]*>', ' ', text or ''))
+
+    def fields(self, ev):
+        description, abstract = ev.texts
+        return (
+            ev.title or '',
+            str(ev.authors),
+            ev.track,
+            ' '.join([self.strip_html(abstract), self.strip_html(description)]),
+        )
+
+    def update(self):
+        version = self.fosdem.version
+        if version is not None and \
+                self.data.get_value(self.table, self.schedule) == version:
+            return
+
+        indexed = {
+            fosdem_id: (rowid, digest) for rowid, fosdem_id, digest in self.db.execute(
+                'SELECT rowid, fosdem_id, digest FROM %s WHERE schedule=?' % self.table,
+                (self.schedule, )
+            )
+        }
+        with self.data.batch():
+            for ev in self.fosdem.events:
+                fields = self.fields(ev)
+                digest = hashlib.sha1('\0'.join(fields).encode()).hexdigest()
+                rowid, old = indexed.pop(ev.fosdem_id, (None, None))
+                if old == digest:
+                    continue
+                if rowid is not None:
+                    self.db.execute('DELETE FROM %s WHERE rowid=?' % self.table, (rowid, ))
+                self.db.execute(
+                    'INSERT INTO %s VALUES (?, ?, ?, ?, ?, ?, ?)' % self.table,
+                    (self.schedule, ev.fosdem_id, digest) + fields
+                )
+            for rowid, _ in indexed.values():
+                self.db.execute('DELETE FROM %s WHERE rowid=?' % self.table, (rowid, ))
+            if version is not None:
+                if self.data.get_value(self.table, self.schedule) is None:
+                    self.data.insert(self.table, self.schedule, version)
+                else:
+                    self.data.update(self.table, self.schedule, version)
+
+    def query(self, text, limit=100):
+        """Events matching all words of text, words being prefixes, best
+        matches first."""
+        words = re.findall(r'\w+', text)
+        if not words:
+            return []
+        match = ' '.join('"%s"*' % w for w in words)
+        events = []
+        for fosdem_id, in self.db.execute('''
+            SELECT fosdem_id FROM %s
+            WHERE %s MATCH ? AND schedule=?
+            ORDER BY rank LIMIT ?
+        ''' % (self.table, self.table), (match, self.schedule, limit)):
+            try:
+                events.append(self.fosdem.get_event(fosdem_id))
+            except KeyError:
+                pass
+        return events
+
+class NoteSearch:
+    """Full text search over note bodies, in an FTS5 table kept next to
+    the notes.
+
+    Note titles get a stable id in a side table, as dynamo has no rowid
+    to share with the index. The index is filled from dynamo in one
+    statement the first time, without reading the notes into Python, and
+    then kept up by a write hook on the notes, so it is updated in the
+    same transaction as the note, by whichever thread writes it.
+    """
+    table = 'note_search'
+
+    def __init__(self, data):
+        self.data = data
+        self.db = data.db
+        self.db.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(
+                title, body,
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''' % self.table)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS %s_ids (
+                id INTEGER PRIMARY KEY,
+                title TEXT UNIQUE NOT NULL
+            )
+        ''' % self.table)
+        if self.data.get_value(self.table, 'built') is None:
+            self.build()
+        data.add_write_hook('note', self.update)
+
+    def build(self):
+        with self.data.batch():
+            self.db.execute('DELETE FROM %s' % self.table)
+            self.db.execute('DELETE FROM %s_ids' % self.table)
+            self.db.execute('''
+                INSERT INTO %s_ids (title)
+                SELECT sortkey FROM dynamo WHERE hashkey='note'
+            ''' % self.table)
+            self.db.execute('''
+                INSERT INTO %s (rowid, title, body)
+                SELECT ids.id, ids.title, dynamo.value
+                FROM dynamo JOIN %s_ids AS ids ON ids.title=dynamo.sortkey
+                WHERE dynamo.hashkey='note'
+            ''' % (self.table, self.table))
+            self.data.insert(self.table, 'built', 1)
+
+    def update(self, data, op, title, content):
+        """The write hook: reindex a note, through data's connection."""
+        db = data.db
+        db.execute('INSERT OR IGNORE INTO %s_ids (title) VALUES (?)' % self.table, (title, ))
+        rowid, = next(db.execute('SELECT id FROM %s_ids WHERE title=?' % self.table, (title, )))
+        db.execute('DELETE FROM %s WHERE rowid=?' % self.table, (rowid, ))
+        if op == 'put':
+            db.execute(
+                'INSERT INTO %s (rowid, title, body) VALUES (?, ?, ?)' % self.table,
+                (rowid, title, content or '')
+            )
+
+    def query(self, text, limit=100):
+        """Titles of the notes matching all words of text, words being
+        prefixes, best matches first."""
+        words = re.findall(r'\w+', text)
+        if not words:
+            return []
+        match = ' '.join('"%s"*' % w for w in words)
+        return [title for title, in self.db.execute('''
+            SELECT title FROM %s WHERE %s MATCH ?
+            ORDER BY rank LIMIT ?
+        ''' % (self.table, self.table), (match, limit))]
+
+class TitleMatcher:
+    """Fuzzy matching of titles: the typed characters have to appear in
+    order, and tighter, earlier matches rank first.
+
+    Typing on narrows the previous matches instead of starting over.
+    """
+    def __init__(self, titles):
+        self.titles = sorted(titles)
+        self.text = None
+        self.candidates = self.titles
+
+    def add(self, title):
+        i = bisect.bisect_left(self.titles, title)
+        if i == len(self.titles) or self.titles[i] != title:
+            self.titles.insert(i, title)
+            self.text = None
+            self.candidates = self.titles
+
+    def match(self, text, limit=100):
+        if not text:
+            return self.titles[:limit]
+        pool = self.titles
+        if self.text is not None and text.startswith(self.text):
+            pool = self.candidates
+        pattern = re.compile('.*?'.join(map(re.escape, text)), re.IGNORECASE)
+        scored = []
+        for title in pool:
+            m = pattern.search(title)
+            if m is not None:
+                scored.append((m.end() - m.start(), m.start(), title))
+        self.text = text
+        self.candidates = [title for _, _, title in scored]
+        return [title for _, _, title in heapq.nsmallest(limit, scored)]
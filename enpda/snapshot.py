@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class ScheduleSnapshot:
+    """A compiled copy of a parsed schedule, in a sqlite file.
+
+    The snapshot is keyed on the source file's path and checked against
+    its mtime and size; if those changed but the content hash did not,
+    the snapshot is still used. Loading one never touches the XML.
+    """
+    version = 3
+
+    def __init__(self, cachedir, filename):
+        self.filename = os.path.abspath(filename)
+        name = hashlib.sha1(self.filename.encode()).hexdigest()[:16]
+        self.path = os.path.join(cachedir, '%s.db' % name)
+        self._db = None
+        self.hash = None
+
+    def content_hash(self):
+        h = hashlib.sha1()
+        with open(self.filename, 'rb') as fh:
+            for block in iter(lambda: fh.read(1024 * 1024), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def source_key(self):
+        st = os.stat(self.filename)
+        return {'path': self.filename, 'mtime': str(st.st_mtime_ns), 'size': str(st.st_size)}
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def is_valid(self, db):
+        try:
+            meta = dict(db.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError:
+            return False
+        if meta.get('version') != str(self.version):
+            return False
+        key = self.source_key()
+        if all(meta.get(k) == v for k, v in key.items()):
+            self.hash = meta.get('hash')
+            return True
+        if meta.get('path') != key['path'] or meta.get('hash') != self.content_hash():
+            return False
+        # Touched but unchanged; remember the new mtime.
+        self.hash = meta['hash']
+        with db:
+            db.executemany('REPLACE INTO meta VALUES (?, ?)', key.items())
+        return True
+
+    def load(self, fosdem):
+        """Fill an empty Fosdem from the snapshot, if it's up to date."""
+        if not os.path.exists(self.path):
+            return False
+        db = self.connect()
+        try:
+            if not self.is_valid(db):
+                return False
+            for dayidx, in db.execute('SELECT idx FROM days ORDER BY rowid'):
+                fosdem.add_day(dayidx)
+            for row in db.execute('SELECT name, day, date, room FROM tracks ORDER BY rowid'):
+                fosdem.add_track(*row)
+
+            authors = {}
+            for event, name, person_id in db.execute(
+                    'SELECT event, name, person_id FROM persons ORDER BY rowid'):
+                authors.setdefault(event, []).append((name, person_id))
+
+            for row in db.execute('''
+                SELECT rowid, fosdem_id, title, track, room, date, duration,
+                       start_time
+                FROM events ORDER BY rowid
+            '''):
+                fosdem.add_event(
+                    fosdem_id=row[1], title=row[2], authors=authors.get(row[0], []),
+                    track=row[3], room=row[4], date=row[5], duration=row[6],
+                    start_time=row[7],
+                )
+        finally:
+            db.close()
+        fosdem.set_text_source(self)
+        return True
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = self.connect()
+        return self._db
+
+    def text_size(self):
+        """Characters of description, abstract and plain text stored for
+        all events."""
+        size, = next(self.db.execute('''
+            SELECT total(length(description)) + total(length(abstract)) +
+                   total(length(text))
+            FROM events
+        '''))
+        return int(size)
+
+    def get_texts(self, fosdem_id):
+        for row in self.db.execute(
+                'SELECT description, abstract FROM events WHERE fosdem_id=?',
+                (fosdem_id, )):
+            return row
+        return None, None
+
+    def all_texts(self):
+        """(description, abstract) of every event, by fosdem id."""
+        return {
+            fosdem_id: (description, abstract) for fosdem_id, description, abstract in
+            self.db.execute('SELECT fosdem_id, description, abstract FROM events')
+        }
+
+    def get_text(self, fosdem_id):
+        for text, in self.db.execute(
+                'SELECT text FROM events WHERE fosdem_id=?', (fosdem_id, )):
+            return text
+
+    def set_text(self, fosdem_id, text):
+        with self.db:
+            self.db.execute(
+                'UPDATE events SET text=? WHERE fosdem_id=?', (text, fosdem_id)
+            )
+
+    def precompute_texts(self, convert, workers=2):
+        """Fill in the plain text of every event that lacks it, using
+        convert(description, abstract), in a background thread pool."""
+        def run():
+            db = self.connect()
+            try:
+                rows = list(db.execute(
+                    'SELECT fosdem_id, description, abstract FROM events WHERE text IS NULL'
+                ))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    texts = list(pool.map(lambda row: convert(*row[1:]), rows))
+                with db:
+                    db.executemany('UPDATE events SET text=? WHERE fosdem_id=?', [
+                        (text, row[0]) for text, row in zip(texts, rows)
+                    ])
+            finally:
+                db.close()
+
+        thread = threading.Thread(target=run, name='precompute-texts', daemon=True)
+        thread.start()
+        return thread
+
+    def save(self, fosdem):
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        db = sqlite3.connect(tmp)
+        try:
+            with db:
+                db.executescript('''
+                    CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+                    CREATE TABLE days (idx INTEGER);
+                    CREATE TABLE tracks (name TEXT, day INTEGER, date TEXT, room TEXT);
+                    CREATE TABLE events (
+                        fosdem_id TEXT, title TEXT, track TEXT, room TEXT,
+                        date TEXT, duration TEXT, start_time TEXT,
+                        description TEXT, abstract TEXT, text TEXT
+                    );
+                    CREATE INDEX events_fosdem_id ON events (fosdem_id);
+                    CREATE TABLE persons (event INTEGER, name TEXT, person_id TEXT);
+                ''')
+                db.executemany('INSERT INTO days VALUES (?)', [
+                    (int(day.split()[1]), ) for day in fosdem.days
+                ])
+                db.executemany('INSERT INTO tracks VALUES (?, ?, ?, ?)', [
+                    (track, info['day'], info['date'], info['room'])
+                    for track, info in fosdem.trackinfo.items()
+                ])
+                for ev in fosdem.events:
+                    cur = db.execute('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                        ev.fosdem_id, ev.title, ev.track, ev.room, ev.date,
+                        ev.duration, ev.start_time, *ev.texts, ev._text,
+                    ))
+                    db.executemany('INSERT INTO persons VALUES (?, ?, ?)', [
+                        (cur.lastrowid, a.name, a.fosdem_id) for a in ev.authors.authors
+                    ])
+                meta = self.source_key()
+                meta['hash'] = self.hash = self.content_hash()
+                meta['version'] = str(self.version)
+                db.executemany('INSERT INTO meta VALUES (?, ?)', meta.items())
+        finally:
+            db.close()
+        os.replace(tmp, self.path)
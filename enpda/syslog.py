@@ -1,4 +1,15 @@
+import os
 import re
+import gzip
+import heapq
+import json
+import zlib
+import shlex
+import bisect
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import urwid
 from enpda.view import View
 
@@ -29,18 +40,857 @@ class SyslogLine:
             self.service = 'unknown'
             self.msg = 'unparsed line: %s' % self.line
 
+    @property
+    def timekey(self):
+        return time_key(self.date, self.time)
+
     def __str__(self):
         return self.line
 
+months = {
+    m: i for i, m in enumerate([
+        'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec',
+    ], 1)
+}
+
+def time_key(date, time):
+    """Turn a syslog 'Mon DD' date and 'HH:MM[:SS]' time into a sortable int.
+
+    Syslog timestamps carry no year, so this only orders within one.
+    Returns None for anything that doesn't look like a timestamp.
+    """
+    try:
+        month, day = date.split()
+        hms = [int(x) for x in time.split(':')]
+        hms += [0] * (3 - len(hms))
+        return ((months[month] * 32 + int(day)) * 24 + hms[0]) * 3600 + \
+            hms[1] * 60 + hms[2]
+    except (KeyError, ValueError):
+        return None
+
+class SyslogColumns:
+    """Parsed fields of many log lines, column by column.
+
+    Services and hostnames are interned: the services and hosts columns
+    hold indexes into service_names and host_names. Lines without a
+    usable timestamp have -1 in the times column.
+    """
+    def __init__(self):
+        self.offsets = array('q')
+        self.times = array('q')
+        self.services = array('l')
+        self.hosts = array('l')
+        self.service_names = []
+        self.host_names = []
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def extend(self, other):
+        for names, ids, other_names, other_ids in [
+            (self.service_names, self.services, other.service_names, other.services),
+            (self.host_names, self.hosts, other.host_names, other.hosts),
+        ]:
+            known = {name: i for i, name in enumerate(names)}
+            remap = []
+            for name in other_names:
+                if name not in known:
+                    known[name] = len(names)
+                    names.append(name)
+                remap.append(known[name])
+            ids.extend(remap[i] for i in other_ids)
+        self.offsets.extend(other.offsets)
+        self.times.extend(other.times)
+
+line_pattern_bytes = re.compile(SyslogLine.line_pattern.pattern.encode(), re.X)
+
+def parse_range(path, start, end):
+    """Parse the lines in [start, end) of path, which must both be line
+    boundaries, into SyslogColumns."""
+    cols = SyslogColumns()
+    service_ids = {}
+    host_ids = {}
+    match = line_pattern_bytes.match
+    stamp, key = None, -1
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    lines = data.split(b'\n')
+    if data.endswith(b'\n'):
+        lines.pop()
+    offset = start
+    for line in lines:
+        m = match(line)
+        if m:
+            date, time, host, service = m.group('date', 'time', 'hostname', 'service')
+            # Consecutive lines mostly share a timestamp.
+            if (date, time) != stamp:
+                stamp = (date, time)
+                key = time_key(date.decode('ascii', 'replace'), time.decode('ascii', 'replace'))
+                key = -1 if key is None else key
+            cols.times.append(key)
+        else:
+            host = service = b'unknown'
+            cols.times.append(-1)
+        if service not in service_ids:
+            service_ids[service] = len(cols.service_names)
+            cols.service_names.append(service.decode('utf-8', 'replace'))
+        if host not in host_ids:
+            host_ids[host] = len(cols.host_names)
+            cols.host_names.append(host.decode('utf-8', 'replace'))
+        cols.offsets.append(offset)
+        cols.services.append(service_ids[service])
+        cols.hosts.append(host_ids[host])
+        offset += len(line) + 1
+    return cols
+
+def split_ranges(path, start, end, count):
+    """Cut [start, end) of path into about count line aligned ranges."""
+    step = max(1, (end - start) // count)
+    bounds = [start]
+    with open(path, 'rb') as fh:
+        for pos in range(start + step, end, step):
+            fh.seek(pos - 1)
+            fh.readline()
+            pos = fh.tell()
+            if bounds[-1] < pos < end:
+                bounds.append(pos)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+def parse_columns(path, start=0, end=None, workers=None, chunk_size=8 * 1024 * 1024):
+    """Parse lines of path between the line boundaries start and end, in
+    a pool of worker processes, returning SyslogColumns."""
+    if end is None:
+        end = os.path.getsize(path)
+    cols = SyslogColumns()
+    if end <= start:
+        return cols
+    count = max(1, (end - start) // chunk_size)
+    ranges = split_ranges(path, start, end, count)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(ranges) == 1 or workers == 1:
+        for lo, hi in ranges:
+            cols.extend(parse_range(path, lo, hi))
+        return cols
+    # Forking the UI process would copy the locks held by its other
+    # threads (data writer, text precomputation) into the workers.
+    context = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for part in pool.map(parse_range, *zip(*((path, lo, hi) for lo, hi in ranges))):
+            cols.extend(part)
+    return cols
+
+class SyslogFile:
+    """Line index over a log file, built backwards from the end.
+
+    Only the byte offset of each line start is kept in memory; the
+    index grows one block at a time as older lines are asked for.
+    """
+    block_size = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.fh = open(path, 'rb')
+        st = os.fstat(self.fh.fileno())
+        self.inode = (st.st_dev, st.st_ino)
+        self.end = st.st_size
+        self.start = self.end
+        self.offsets = array('q')
+
+    def close(self):
+        self.fh.close()
+
+    def rotated(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (st.st_dev, st.st_ino) != self.inode or st.st_size < self.end
+
+    def read_forward(self):
+        """Index whatever was appended since the last call.
+
+        Returns the new line offsets, plus the offset of the previously
+        last line if it was incomplete and has grown since.
+        """
+        size = os.fstat(self.fh.fileno()).st_size
+        if size <= self.end:
+            return [], None
+        self.fh.seek(self.end)
+        data = self.fh.read(size - self.end)
+        if not data:
+            return [], None
+
+        grown = None
+        starts = []
+        if self.end == 0 or self.ends_with_newline():
+            starts.append(self.end)
+        elif self.offsets:
+            grown = self.offsets[-1]
+        i = data.find(b'\n')
+        while i != -1 and i + 1 < len(data):
+            starts.append(self.end + i + 1)
+            i = data.find(b'\n', i + 1)
+
+        if self.start == self.end:
+            self.start = starts[0] if starts else self.start
+        self.end += len(data)
+        self.offsets.extend(starts)
+        return starts, grown
+
+    def ends_with_newline(self):
+        self.fh.seek(self.end - 1)
+        return self.fh.read(1) == b'\n'
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def complete(self):
+        return self.start == 0
+
+    def read_back(self):
+        if self.complete:
+            return False
+        begin = self.start
+        starts = []
+        while not starts and begin > 0:
+            begin = max(0, begin - self.block_size)
+            self.fh.seek(begin)
+            data = self.fh.read(self.start - begin)
+            if begin == 0:
+                starts.append(0)
+            i = data.find(b'\n')
+            while i != -1 and begin + i + 1 < self.start:
+                starts.append(begin + i + 1)
+                i = data.find(b'\n', i + 1)
+        self.offsets[0:0] = array('q', starts)
+        self.start = starts[0]
+        return True
+
+    def index(self, offset):
+        i = bisect.bisect_left(self.offsets, offset)
+        if i == len(self.offsets) or self.offsets[i] != offset:
+            raise KeyError(offset)
+        return i
+
+    def last(self):
+        if not self.offsets:
+            self.read_back()
+        if not self.offsets:
+            return None
+        return self.offsets[-1]
+
+    def first(self):
+        while self.read_back():
+            pass
+        return self.offsets[0] if self.offsets else None
+
+    def position(self, offset):
+        return offset
+
+    def next_offset(self, offset):
+        i = self.index(offset) + 1
+        if i >= len(self.offsets):
+            raise IndexError(offset)
+        return self.offsets[i]
+
+    def prev_offset(self, offset):
+        i = self.index(offset)
+        if i == 0:
+            if not self.read_back():
+                raise IndexError(offset)
+            i = self.index(offset)
+        return self.offsets[i-1]
+
+    def line(self, offset):
+        self.fh.seek(offset)
+        return self.fh.readline().decode('utf-8', 'replace').rstrip('\n')
+
+class SyslogGzipFile(SyslogFile):
+    """A gzip compressed, rotated away log.
+
+    gzip streams can't be read backwards, so the first time an archive
+    is opened it is decompressed once, front to back, into a copy made
+    of separately compressed ~1M members cut at line boundaries. That
+    copy and the line index are kept in cachedir, keyed on the archive's
+    size and mtime, after which any line is at most one member away.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path, cachedir):
+        self.path = path
+        st = os.stat(path)
+        self.key = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+        name = os.path.basename(path)
+        self.index_path = os.path.join(cachedir, name + '.idx')
+        self.chunks_path = os.path.join(cachedir, name + '.chunks.gz')
+        if not self.load_index():
+            self.build_index()
+        self.fh = open(self.chunks_path, 'rb')
+        self.start = 0
+        self._chunk = (None, b'')
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'rb') as fh:
+                header = json.loads(fh.readline())
+                if header['key'] != self.key:
+                    return False
+                self.end = header['end']
+                self.offsets = array('q')
+                self.offsets.fromfile(fh, header['lines'])
+                self.chunk_starts = array('q')
+                self.chunk_starts.fromfile(fh, header['chunks'])
+                self.chunk_pos = array('q')
+                self.chunk_pos.fromfile(fh, header['chunks'] + 1)
+                return True
+        except (OSError, ValueError, KeyError, EOFError):
+            return False
+
+    def build_index(self):
+        self.offsets = array('q')
+        self.chunk_starts = array('q')
+        self.chunk_pos = array('q')
+        pos = 0
+        pending = b''
+        with gzip.open(self.path, 'rb') as src, open(self.chunks_path, 'wb') as dst:
+            while True:
+                data = src.read(self.chunk_size)
+                pending += data
+                cut = pending.rfind(b'\n') + 1 if data else len(pending)
+                if cut:
+                    chunk, pending = pending[:cut], pending[cut:]
+                    self.chunk_starts.append(pos)
+                    self.chunk_pos.append(dst.tell())
+                    dst.write(gzip.compress(chunk, compresslevel=1))
+                    i = 0
+                    while i < len(chunk):
+                        self.offsets.append(pos + i)
+                        i = chunk.find(b'\n', i) + 1 or len(chunk)
+                    pos += len(chunk)
+                if not data:
+                    break
+            self.chunk_pos.append(dst.tell())
+        self.end = pos
+
+        with open(self.index_path, 'wb') as fh:
+            fh.write(json.dumps({
+                'key': self.key,
+                'end': self.end,
+                'lines': len(self.offsets),
+                'chunks': len(self.chunk_starts),
+            }).encode() + b'\n')
+            self.offsets.tofile(fh)
+            self.chunk_starts.tofile(fh)
+            self.chunk_pos.tofile(fh)
+
+    def rotated(self):
+        return False
+
+    def read_forward(self):
+        return [], None
+
+    def read_back(self):
+        return False
+
+    def chunk(self, i):
+        if self._chunk[0] != i:
+            self.fh.seek(self.chunk_pos[i])
+            data = self.fh.read(self.chunk_pos[i+1] - self.chunk_pos[i])
+            self._chunk = (i, zlib.decompress(data, wbits=31))
+        return self._chunk[1]
+
+    def line(self, offset):
+        i = bisect.bisect_right(self.chunk_starts, offset) - 1
+        data = self.chunk(i)
+        begin = offset - self.chunk_starts[i]
+        end = data.find(b'\n', begin)
+        line = data[begin:] if end == -1 else data[begin:end]
+        return line.decode('utf-8', 'replace')
+
+class SyslogTimeline:
+    """The current log followed by its rotated archives, newest last.
+
+    Positions are (generation, offset) pairs, where the current log is
+    generation 0, foo.1 is -1, foo.2.gz is -2 and so on, so that they
+    sort in time order. Archives are only opened once scrolled into.
+    """
+    def __init__(self, logfile, cachedir=None):
+        self.logfile = logfile
+        self.cachedir = cachedir
+        self.archives = []
+        self._segments = {0: logfile}
+        n = 1
+        while True:
+            path = '%s.%d' % (logfile.path, n)
+            if os.path.exists(path):
+                self.archives.append(path)
+            elif os.path.exists(path + '.gz') and cachedir is not None:
+                self.archives.append(path + '.gz')
+            else:
+                break
+            n += 1
+
+    def close(self):
+        for gen, segment in self._segments.items():
+            if gen:
+                segment.close()
+
+    def segment(self, gen):
+        if gen not in self._segments:
+            if not 0 < -gen <= len(self.archives):
+                raise IndexError(gen)
+            path = self.archives[-gen-1]
+            if path.endswith('.gz'):
+                self._segments[gen] = SyslogGzipFile(path, self.cachedir)
+            else:
+                self._segments[gen] = SyslogFile(path)
+        return self._segments[gen]
+
+    def position(self, offset):
+        return (0, offset)
+
+    def last(self):
+        gen = 0
+        while True:
+            try:
+                offset = self.segment(gen).last()
+            except IndexError:
+                return None
+            if offset is not None:
+                return (gen, offset)
+            gen -= 1
+
+    def first(self):
+        for gen in range(-len(self.archives), 1):
+            offset = self.segment(gen).first()
+            if offset is not None:
+                return (gen, offset)
+        return None
+
+    def next_offset(self, position):
+        gen, offset = position
+        try:
+            return (gen, self.segment(gen).next_offset(offset))
+        except IndexError:
+            pass
+        while gen < 0:
+            gen += 1
+            offset = self.segment(gen).first()
+            if offset is not None:
+                return (gen, offset)
+        raise IndexError(position)
+
+    def prev_offset(self, position):
+        gen, offset = position
+        try:
+            return (gen, self.segment(gen).prev_offset(offset))
+        except IndexError:
+            pass
+        while True:
+            gen -= 1
+            offset = self.segment(gen).last()
+            if offset is not None:
+                return (gen, offset)
+
+    def line(self, position):
+        gen, offset = position
+        return self.segment(gen).line(offset)
+
+class SyslogIndex:
+    """Offsets of parsed lines by service, hostname and timestamp.
+
+    Lines are parsed once, front to back; update() only looks at what
+    was written since the previous call.
+    """
+    block_size = 1024 * 1024
+    parallel_threshold = 16 * 1024 * 1024
+
+    def __init__(self):
+        self.upto = 0
+        self.services = {}
+        self.hosts = {}
+        self.time_keys = array('q')
+        self.time_offsets = array('q')
+
+    def update(self, logfile, parallel=False, collect=False):
+        """Parse complete lines up to logfile.end; with collect set,
+        returns the new entries as (offset, SyslogLine) pairs.
+
+        With parallel set, large backlogs are instead parsed by
+        parse_columns, and left out of the entries.
+        """
+        if parallel and logfile.end - self.upto > self.parallel_threshold:
+            logfile.fh.seek(max(self.upto, logfile.end - self.block_size))
+            tail = logfile.fh.read(logfile.end - logfile.fh.tell())
+            end = logfile.end - len(tail) + tail.rfind(b'\n') + 1
+            if end > self.upto:
+                self.add_columns(parse_columns(logfile.path, self.upto, end))
+                self.upto = end
+        entries = [] if collect else None
+        late = []
+        fh = logfile.fh
+        fh.seek(self.upto)
+        pending = b''
+        pos = self.upto
+        while pos < logfile.end:
+            data = fh.read(min(self.block_size, logfile.end - pos))
+            if not data:
+                break
+            pos += len(data)
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                entry = self.add(self.upto, line, late)
+                if collect:
+                    entries.append((self.upto, entry))
+                self.upto += len(line) + 1
+        late.sort(key=lambda pair: pair[0])
+        self.merge_times(late)
+        return entries
+
+    def add(self, offset, line, late):
+        """Index a line. A timestamp older than the newest one indexed
+        (the year rolling over, say) goes to late, for merge_times()."""
+        entry = SyslogLine(line.decode('utf-8', 'replace'))
+        self.services.setdefault(entry.service, array('q')).append(offset)
+        self.hosts.setdefault(entry.hostname, array('q')).append(offset)
+        key = entry.timekey
+        if key is not None:
+            if self.time_keys and key < self.time_keys[-1]:
+                late.append((key, offset))
+            else:
+                self.time_keys.append(key)
+                self.time_offsets.append(offset)
+        return entry
+
+    def add_columns(self, cols):
+        services = [self.services.setdefault(name, array('q')) for name in cols.service_names]
+        hosts = [self.hosts.setdefault(name, array('q')) for name in cols.host_names]
+        for offset, service, host in zip(cols.offsets, cols.services, cols.hosts):
+            services[service].append(offset)
+            hosts[host].append(offset)
+
+        timed = [i for i, key in enumerate(cols.times) if key >= 0]
+        timed.sort(key=cols.times.__getitem__)
+        self.merge_times([(cols.times[i], cols.offsets[i]) for i in timed])
+
+    def merge_times(self, pairs):
+        """Add (time key, offset) pairs, sorted on key, in one pass."""
+        if pairs and self.time_keys and pairs[0][0] < self.time_keys[-1]:
+            merged = list(heapq.merge(
+                zip(self.time_keys, self.time_offsets), pairs, key=lambda x: x[0],
+            ))
+            self.time_keys = array('q', (key for key, _ in merged))
+            self.time_offsets = array('q', (offset for _, offset in merged))
+        else:
+            self.time_keys.extend(key for key, _ in pairs)
+            self.time_offsets.extend(offset for _, offset in pairs)
+
+    def time_range(self, since=None, until=None):
+        lo = 0 if since is None else bisect.bisect_left(self.time_keys, since)
+        hi = len(self.time_keys) if until is None else \
+            bisect.bisect_right(self.time_keys, until)
+        return array('q', sorted(self.time_offsets[lo:hi]))
+
+    def query(self, query):
+        """Offsets matching every constraint in the SyslogQuery, in file order."""
+        result = None
+        for offsets in [
+            query.service is not None and self.services.get(query.service, array('q')),
+            query.host is not None and self.hosts.get(query.host, array('q')),
+            query.timed and self.time_range(query.since, query.until),
+        ]:
+            if offsets is False:
+                continue
+            if result is None:
+                result = offsets
+            else:
+                keep = set(offsets)
+                result = array('q', [o for o in result if o in keep])
+        return array('q', result if result is not None else [])
+
+class SyslogQuery:
+    """A parsed filter prompt, e.g. 'service:sshd since:"Jan 1 10:00"'.
+
+    Times may leave out the date, in which case the date of the last
+    line in the log is used, or the time of day, meaning midnight.
+    """
+    def __init__(self, text, default_date=None):
+        self.text = text
+        self.service = None
+        self.host = None
+        self.since = None
+        self.until = None
+        for token in shlex.split(text):
+            field, _, value = token.partition(':')
+            if field == 'service':
+                self.service = value
+            elif field == 'host':
+                self.host = value
+            elif field in ['since', 'until']:
+                parts = value.split()
+                if len(parts) == 1 and default_date:
+                    parts = default_date.split() + parts
+                # A date on its own means the start of that day.
+                key = time_key(' '.join(parts[:2]), ''.join(parts[2:3]) or '00:00')
+                if key is None:
+                    raise ValueError('bad time: %s' % value)
+                setattr(self, field, key)
+            else:
+                raise ValueError('unknown filter: %s' % token)
+
+    @property
+    def timed(self):
+        return self.since is not None or self.until is not None
+
+    def match(self, entry):
+        if self.service is not None and entry.service != self.service:
+            return False
+        if self.host is not None and entry.hostname != self.host:
+            return False
+        if self.timed:
+            key = entry.timekey
+            if key is None:
+                return False
+            if self.since is not None and key < self.since:
+                return False
+            if self.until is not None and key > self.until:
+                return False
+        return True
+
+    def __str__(self):
+        return self.text
+
+class SyslogSelection:
+    """A subset of a SyslogFile's lines, navigated the same way."""
+    def __init__(self, logfile, offsets):
+        self.logfile = logfile
+        self.offsets = offsets
+
+    def index(self, offset):
+        i = bisect.bisect_left(self.offsets, offset)
+        if i == len(self.offsets) or self.offsets[i] != offset:
+            raise KeyError(offset)
+        return i
+
+    def last(self):
+        return self.offsets[-1] if self.offsets else None
+
+    def first(self):
+        return self.offsets[0] if self.offsets else None
+
+    def position(self, offset):
+        return offset
+
+    def next_offset(self, offset):
+        i = self.index(offset) + 1
+        if i >= len(self.offsets):
+            raise IndexError(offset)
+        return self.offsets[i]
+
+    def prev_offset(self, offset):
+        i = self.index(offset)
+        if i == 0:
+            raise IndexError(offset)
+        return self.offsets[i-1]
+
+    def line(self, offset):
+        return self.logfile.line(offset)
+
+class SyslogWalker(urwid.ListWalker):
+    """Walks a SyslogTimeline, or a filtered SyslogSelection of the
+    current log.
+
+    Row widgets are built on demand and only a small number of them are
+    kept around.
+    """
+    cache_size = 256
+
+    def __init__(self, logfile, make_line, cachedir=None):
+        self.logfile = logfile
+        self.cachedir = cachedir
+        self.timeline = SyslogTimeline(logfile, cachedir)
+        self.lines = self.timeline
+        self.make_line = make_line
+        self.index = None
+        self.query = None
+        self._widgets = OrderedDict()
+        self.focus = self.lines.last()
+
+    def __getitem__(self, position):
+        if position is None:
+            raise IndexError(position)
+        try:
+            self._widgets.move_to_end(position)
+            return self._widgets[position]
+        except KeyError:
+            pass
+        w = self.make_line(self.lines.line(position))
+        self._widgets[position] = w
+        if len(self._widgets) > self.cache_size:
+            self._widgets.popitem(last=False)
+        return w
+
+    def next_position(self, position):
+        return self.lines.next_offset(position)
+
+    def prev_position(self, position):
+        return self.lines.prev_offset(position)
+
+    def positions(self, reverse=False):
+        """Positions from either end, walked lazily; ListBox only takes the
+        first one, for home and end."""
+        position = self.lines.last() if reverse else self.lines.first()
+        step = self.prev_position if reverse else self.next_position
+        while position is not None:
+            yield position
+            try:
+                position = step(position)
+            except IndexError:
+                return
+
+    def set_filter(self, query):
+        if query is None:
+            self.query = None
+            self.lines = self.timeline
+        else:
+            if self.index is None:
+                self.index = SyslogIndex()
+            self.index.update(self.logfile, parallel=True)
+            self.query = query
+            self.lines = SyslogSelection(self.logfile, self.index.query(query))
+        self.set_focus(self.lines.last())
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    @property
+    def at_end(self):
+        return self.focus == self.lines.last()
+
+    def follow(self):
+        """Pick up appended lines, reopening the file if it was rotated.
+
+        Returns True if anything changed.
+        """
+        if self.logfile.rotated():
+            self.logfile.close()
+            self.timeline.close()
+            self.logfile = SyslogFile(self.logfile.path)
+            self.timeline = SyslogTimeline(self.logfile, self.cachedir)
+            self.index = None
+            self._widgets.clear()
+            self.set_filter(self.query)
+            return True
+
+        at_end = self.at_end
+        starts, grown = self.logfile.read_forward()
+        if grown is not None:
+            self._widgets.pop(self.lines.position(grown), None)
+        if self.query is not None:
+            self.lines.offsets.extend(
+                offset for offset, entry in self.index.update(self.logfile, collect=True)
+                if self.query.match(entry)
+            )
+        last = self.lines.last()
+        if last is None or (not starts and grown is None):
+            return False
+        if at_end or self.focus is None:
+            self.set_focus(last)
+        else:
+            self._modified()
+        return True
+
 class SyslogView(View):
-    def __init__(self, app, logpath='/var/log/syslog', **kwargs):
+    poll_interval = 1.0
+
+    def __init__(self, app, logpath='/var/log/syslog', follow=True, **kwargs):
         self.logpath = logpath
-        lines = self.read_syslog()
-        self._syslog = urwid.ListBox(
-            urwid.SimpleFocusListWalker([self.make_line(l) for l in lines])
+        self.walker = SyslogWalker(
+            self.read_syslog(), self.make_line,
+            cachedir=app.data.cache_path('syslog'),
         )
-        super().__init__(app=app, body=self._syslog)
-        self._syslog.set_focus(len(self._syslog.body)-1)
+        self._syslog = urwid.ListBox(self.walker)
+        self._status = urwid.Text('', 'right')
+        self._prompt = SyslogFilterPrompt(self.apply_filter)
+        super().__init__(app=app, body=self._syslog, footer=self._status)
+        self.following = False
+        self._poll = None
+        if follow:
+            self.toggle_follow()
+
+    def update_status(self, message=None):
+        status = []
+        for part in [
+            message,
+            self.walker.query and 'filter: %s' % self.walker.query,
+            self.following and 'follow',
+        ]:
+            if part:
+                status += [' | ', part] if status else [part]
+        self._status.set_text(status)
+
+    def open_filter(self):
+        self._prompt.edit_text = str(self.walker.query or '')
+        self.footer = self._prompt
+        self.focus_position = 'footer'
+
+    def apply_filter(self, text):
+        self.footer = self._status
+        self.focus_position = 'body'
+        if text is None:
+            return self.update_status()
+        try:
+            query = SyslogQuery(text, self.last_date()) if text.strip() else None
+        except ValueError as exc:
+            return self.update_status(('error', str(exc)))
+        self.walker.set_filter(query)
+        self.update_status()
+
+    def last_date(self):
+        offset = self.walker.logfile.last()
+        if offset is not None:
+            return SyslogLine(self.walker.logfile.line(offset)).date
+
+    def toggle_follow(self):
+        self.following = not self.following
+        self.update_status()
+        if self.following:
+            self._syslog.set_focus_valign('bottom')
+            self.schedule_poll()
+        elif self._poll is not None:
+            self.app.loop.remove_alarm(self._poll)
+            self._poll = None
+
+    def schedule_poll(self):
+        if self.app.loop is not None:
+            self._poll = self.app.loop.set_alarm_in(self.poll_interval, self.poll)
+
+    def poll(self, loop, user_data=None):
+        self._poll = None
+        # Stop polling once the view has been replaced or follow turned off.
+        if not self.following or self.app.contents['body'][0] is not self:
+            return
+        if self.walker.follow() and self.walker.at_end:
+            self._syslog.set_focus_valign('bottom')
+        self.schedule_poll()
+
+    def keypress(self, size, key):
+        if self.focus_position == 'footer':
+            return super().keypress(size, key)
+        if key == 'F':
+            self.toggle_follow()
+            return
+        if key == '/':
+            self.open_filter()
+            return
+        return super().keypress(size, key)
 
     def make_line(self, line):
         entry = SyslogLine(line.strip())
@@ -52,5 +902,18 @@ class SyslogView(View):
         return urwid.Columns(cols, dividechars=2)
 
     def read_syslog(self):
-        with open('/var/log/syslog') as fh:
-            return fh.readlines()
+        return SyslogFile(self.logpath)
+
+class SyslogFilterPrompt(urwid.Edit):
+    def __init__(self, on_submit):
+        self.on_submit = on_submit
+        super().__init__(caption='filter: ')
+
+    def keypress(self, size, key):
+        if key == 'enter':
+            self.on_submit(self.edit_text)
+            return
+        if key == 'esc':
+            self.on_submit(None)
+            return
+        return super().keypress(size, key)
@@ -0,0 +1,375 @@
+import urwid
+from urwid.str_util import calc_text_pos, calc_width
+from urwid.text_layout import calc_coords
+
+class Fenwick:
+    """Prefix sums over a list of counts, updated and searched in
+    O(log n)."""
+    def __init__(self, counts):
+        self.n = len(counts)
+        self.tree = [0] + list(counts)
+        for i in range(1, self.n + 1):
+            j = i + (i & -i)
+            if j <= self.n:
+                self.tree[j] += self.tree[i]
+
+    def add(self, i, delta):
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """The sum of the first i counts."""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def search(self, value):
+        """(i, rest): the first i whose prefix sum through i exceeds value,
+        and what is left of value after the counts before i."""
+        pos = 0
+        step = 1 << self.n.bit_length()
+        while step:
+            if pos + step <= self.n and self.tree[pos + step] <= value:
+                pos += step
+                value -= self.tree[pos]
+            step >>= 1
+        return pos, value
+
+class TextBuffer:
+    """Text kept as a list of chunks of a few kB, with Fenwick trees over
+    their lengths and newline counts.
+
+    An edit rewrites one chunk and updates both trees, and a line start
+    is found by searching the newline tree and then scanning a single
+    chunk, so neither depends on the size of the text. Chunks that grow
+    too big are split, which rebuilds the trees.
+    """
+    chunk_size = 4096
+
+    def __init__(self, text=''):
+        self.chunks = self.split(text) or ['']
+        self.reindex()
+
+    def split(self, text):
+        return [text[i:i+self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    def reindex(self):
+        self.lengths = Fenwick([len(chunk) for chunk in self.chunks])
+        self.newlines = Fenwick([chunk.count('\n') for chunk in self.chunks])
+        self.length = self.lengths.prefix(len(self.chunks))
+        self.lines = self.newlines.prefix(len(self.chunks)) + 1
+
+    def __len__(self):
+        return self.length
+
+    def locate(self, offset):
+        """(chunk index, offset within it) of a text offset."""
+        if offset >= self.length:
+            return len(self.chunks) - 1, len(self.chunks[-1])
+        return self.lengths.search(offset)
+
+    def insert(self, offset, text):
+        i, o = self.locate(offset)
+        chunk = self.chunks[i]
+        chunk = chunk[:o] + text + chunk[o:]
+        if len(chunk) > 2 * self.chunk_size:
+            self.chunks[i:i+1] = self.split(chunk)
+            self.reindex()
+            return
+        self.chunks[i] = chunk
+        newlines = text.count('\n')
+        self.lengths.add(i, len(text))
+        self.newlines.add(i, newlines)
+        self.length += len(text)
+        self.lines += newlines
+
+    def delete(self, start, end):
+        end = min(end, self.length)
+        emptied = False
+        while start < end:
+            i, o = self.locate(start)
+            chunk = self.chunks[i]
+            removed = chunk[o:o + end - start]
+            self.chunks[i] = chunk[:o] + chunk[o + len(removed):]
+            newlines = removed.count('\n')
+            self.lengths.add(i, -len(removed))
+            self.newlines.add(i, -newlines)
+            self.length -= len(removed)
+            self.lines -= newlines
+            end -= len(removed)
+            emptied = emptied or not self.chunks[i]
+        if emptied and len(self.chunks) > 1:
+            self.chunks = [chunk for chunk in self.chunks if chunk] or ['']
+            self.reindex()
+
+    def text(self, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        if start == 0 and end >= self.length:
+            return ''.join(self.chunks)
+        parts = []
+        while start < end:
+            i, o = self.locate(start)
+            part = self.chunks[i][o:o + end - start]
+            parts.append(part)
+            start += len(part)
+        return ''.join(parts)
+
+    def line_start(self, row):
+        if row <= 0:
+            return 0
+        row = min(row, self.lines - 1)
+        i, before = self.newlines.search(row - 1)
+        chunk = self.chunks[i]
+        pos = -1
+        for _ in range(before + 1):
+            pos = chunk.index('\n', pos + 1)
+        return self.lengths.prefix(i) + pos + 1
+
+    def line_end(self, row):
+        """The offset of the newline ending row, or of the end of text."""
+        if row + 1 >= self.lines:
+            return self.length
+        return self.line_start(row + 1) - 1
+
+    def line_of(self, offset):
+        i, o = self.locate(offset)
+        return self.newlines.prefix(i) + self.chunks[i].count('\n', 0, o)
+
+    def line(self, row):
+        return self.text(self.line_start(row), self.line_end(row))
+
+    def chars(self, offset):
+        """The characters from offset on."""
+        i, o = self.locate(offset)
+        for chunk in self.chunks[i:]:
+            yield from chunk[o:]
+            o = 0
+
+    def chars_back(self, offset):
+        """The characters before offset, nearest first."""
+        if offset <= 0:
+            return
+        i, o = self.locate(offset - 1)
+        yield from reversed(self.chunks[i][:o + 1])
+        for chunk in reversed(self.chunks[:i]):
+            yield from reversed(chunk)
+
+def char_class(c):
+    if c.isspace():
+        return 0
+    if c.isalnum() or c == '_':
+        return 1
+    return 2
+
+class BufferView(urwid.Widget):
+    """A text editing widget over a TextBuffer, rendering only the lines
+    on screen.
+
+    Lines wrap at any character, laid out by urwid.Text so that wide
+    characters and tabs take the columns they are drawn in. Typing and
+    the arrow keys are handled here; Editor drives the vi style motions
+    through move().
+    """
+    _sizing = frozenset(['box'])
+    _selectable = True
+
+    motions = {
+        'h': 'left', 'left': 'left',
+        'l': 'right', 'right': 'right',
+        'k': 'up', 'up': 'up',
+        'j': 'down', 'down': 'down',
+        '^': 'line_start', 'home': 'line_start',
+        '$': 'line_end', 'end': 'line_end',
+        'w': 'word_forward',
+        'b': 'word_backward',
+        'g': 'first_line',
+        'G': 'last_line',
+    }
+
+    def __init__(self, content=''):
+        super().__init__()
+        self.buffer = TextBuffer(content or '')
+        self.cursor = 0
+        self.top = 0
+        # The display column up and down aim for, across shorter lines.
+        self.column = None
+        # Bumped by every edit, to tell whether there is anything to save.
+        self.version = 0
+
+    @property
+    def edit_text(self):
+        return self.buffer.text()
+
+    def position(self):
+        row = self.buffer.line_of(self.cursor)
+        return row, self.cursor - self.buffer.line_start(row)
+
+    def set_cursor(self, offset, column=None):
+        self.cursor = max(0, min(offset, len(self.buffer)))
+        self.column = column
+        self._invalidate()
+
+    def insert(self, text):
+        self.buffer.insert(self.cursor, text)
+        self.version += 1
+        self.set_cursor(self.cursor + len(text))
+
+    def delete(self, start, end):
+        self.buffer.delete(start, end)
+        self.version += 1
+        self._invalidate()
+
+    def move(self, key):
+        getattr(self, 'move_%s' % self.motions[key])()
+
+    def move_left(self):
+        row, col = self.position()
+        if col:
+            self.set_cursor(self.cursor - 1)
+
+    def move_right(self):
+        row, _ = self.position()
+        if self.cursor < self.buffer.line_end(row):
+            self.set_cursor(self.cursor + 1)
+
+    def move_rows(self, delta):
+        row, col = self.position()
+        column = self.column
+        if column is None:
+            column = calc_width(self.buffer.line(row), 0, col)
+        row = max(0, min(row + delta, self.buffer.lines - 1))
+        line = self.buffer.line(row)
+        pos, _ = calc_text_pos(line, 0, len(line), column)
+        self.set_cursor(self.buffer.line_start(row) + pos, column)
+
+    def move_up(self):
+        self.move_rows(-1)
+
+    def move_down(self):
+        self.move_rows(1)
+
+    def move_line_start(self):
+        row, _ = self.position()
+        self.set_cursor(self.buffer.line_start(row))
+
+    def move_line_end(self):
+        row, _ = self.position()
+        self.set_cursor(self.buffer.line_end(row))
+
+    def move_word_forward(self):
+        pos = self.cursor
+        chars = self.buffer.chars(pos)
+        c = next(chars, None)
+        if c is None:
+            return
+        current = char_class(c)
+        while c is not None and current and char_class(c) == current:
+            pos += 1
+            c = next(chars, None)
+        while c is not None and not char_class(c):
+            pos += 1
+            c = next(chars, None)
+        self.set_cursor(pos)
+
+    def move_word_backward(self):
+        pos = self.cursor
+        chars = self.buffer.chars_back(pos)
+        c = next(chars, None)
+        while c is not None and not char_class(c):
+            pos -= 1
+            c = next(chars, None)
+        if c is not None:
+            current = char_class(c)
+            while c is not None and char_class(c) == current:
+                pos -= 1
+                c = next(chars, None)
+        self.set_cursor(pos)
+
+    def move_first_line(self):
+        self.set_cursor(0)
+
+    def move_last_line(self):
+        self.set_cursor(self.buffer.line_start(self.buffer.lines - 1))
+
+    @staticmethod
+    def plain(line):
+        """Whether every character of line takes one column."""
+        return line.isascii() and '\t' not in line
+
+    @staticmethod
+    def layout(line, maxcol):
+        return urwid.Text(line, wrap='any').get_line_translation(maxcol)
+
+    def line_rows(self, row, maxcol):
+        line = self.buffer.line(row)
+        if self.plain(line):
+            return max(1, -(-len(line) // maxcol))
+        return len(self.layout(line, maxcol))
+
+    def coords(self, line, col, maxcol):
+        """Where character col of line is drawn: (x, wrapped row)."""
+        if self.plain(line):
+            y = min(col // maxcol, max(0, len(line) - 1) // maxcol)
+            return col - y * maxcol, y
+        return calc_coords(line, self.layout(line, maxcol), col)
+
+    def scroll(self, size, row, y):
+        """Move top so the cursor, y rows into line row, is on screen."""
+        maxcol, maxrow = size
+        if row < self.top:
+            self.top = row
+        elif row - self.top >= maxrow:
+            self.top = row - maxrow + 1
+        # Wrapped lines above the cursor can still push it off screen.
+        while self.top < row and y + 1 + sum(
+                self.line_rows(r, maxcol) for r in range(self.top, row)) > maxrow:
+            self.top += 1
+
+    def render(self, size, focus=False):
+        maxcol, maxrow = size
+        row, col = self.position()
+        x, y = self.coords(self.buffer.line(row), col, maxcol)
+        self.scroll(size, row, y)
+
+        canvases = []
+        rows = 0
+        cursor = None
+        line = self.top
+        while rows < maxrow and line < self.buffer.lines:
+            canvas = urwid.Text(self.buffer.line(line), wrap='any').render((maxcol, ))
+            if line == row:
+                cursor = (min(x, maxcol - 1), rows + y)
+            canvases.append((canvas, None, False))
+            rows += canvas.rows()
+            line += 1
+        if rows < maxrow:
+            canvases.append((urwid.SolidCanvas(' ', maxcol, maxrow - rows), None, False))
+
+        canvas = urwid.CanvasCombine(canvases)
+        if rows > maxrow:
+            canvas.trim_end(rows - maxrow)
+        if focus and cursor is not None and cursor[1] < maxrow:
+            canvas.cursor = cursor
+        return canvas
+
+    def keypress(self, size, key):
+        if key in self.motions and len(key) > 1:
+            self.move(key)
+        elif key in ['page up', 'page down']:
+            self.move_rows((1 - size[1]) if key == 'page up' else (size[1] - 1))
+        elif key == 'enter':
+            self.insert('\n')
+        elif key == 'backspace':
+            if self.cursor:
+                self.delete(self.cursor - 1, self.cursor)
+                self.set_cursor(self.cursor - 1)
+        elif key == 'delete':
+            self.delete(self.cursor, self.cursor + 1)
+        elif len(key) == 1 and key.isprintable():
+            self.insert(key)
+        else:
+            return key
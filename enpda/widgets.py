@@ -1,4 +1,5 @@
 import urwid
+import bisect
 from urwid.command_map import CURSOR_UP, CURSOR_DOWN
 
 class SelectableText(urwid.SelectableIcon):
@@ -40,3 +41,111 @@ class Header(urwid.Text):
 
     def update_title(self, title):
         self.set_text('%s: %s' % (self.appname, title))
+
+class ScanWalker(urwid.ListWalker):
+    """Walks the sortkeys of a Data collection in order.
+
+    Keys are fetched a page at a time with Data.scan_keys() as the focus
+    gets near either end of the loaded ones, and pages far from it are
+    dropped again. Positions are the sortkeys themselves.
+    """
+    page_size = 64
+    max_keys = 512
+
+    def __init__(self, data, hashkey, make_widget, prefix=None):
+        self.data = data
+        self.hashkey = hashkey
+        self.prefix = prefix
+        self.make_widget = make_widget
+        self._widgets = {}
+        self.keys = list(self.scan(limit=self.page_size))
+        self.complete_start = True
+        self.complete_end = len(self.keys) < self.page_size
+        self.focus = self.keys[0] if self.keys else None
+
+    def scan(self, **kwargs):
+        return self.data.scan_keys(self.hashkey, prefix=self.prefix, **kwargs)
+
+    def __getitem__(self, position):
+        if position is None:
+            raise IndexError(position)
+        w = self._widgets.get(position)
+        if w is None:
+            w = self._widgets[position] = self.make_widget(position)
+        return w
+
+    def next_position(self, position):
+        i = bisect.bisect_right(self.keys, position)
+        if i == len(self.keys) and not self.complete_end:
+            self.load_after()
+            i = bisect.bisect_right(self.keys, position)
+        if i == len(self.keys):
+            raise IndexError(position)
+        return self.keys[i]
+
+    def prev_position(self, position):
+        i = bisect.bisect_left(self.keys, position)
+        if i == 0 and not self.complete_start:
+            self.load_before()
+            i = bisect.bisect_left(self.keys, position)
+        if i == 0:
+            raise IndexError(position)
+        return self.keys[i - 1]
+
+    def load_after(self):
+        page = self.scan(after=self.keys[-1] if self.keys else None, limit=self.page_size)
+        self.keys.extend(page)
+        self.complete_end = len(page) < self.page_size
+        excess = len(self.keys) - self.max_keys
+        if excess > 0:
+            self.drop(self.keys[:excess])
+            del self.keys[:excess]
+            self.complete_start = False
+
+    def load_before(self):
+        page = self.scan(before=self.keys[0], limit=self.page_size, reverse=True)
+        self.keys[:0] = reversed(page)
+        self.complete_start = len(page) < self.page_size
+        excess = len(self.keys) - self.max_keys
+        if excess > 0:
+            self.drop(self.keys[-excess:])
+            del self.keys[-excess:]
+            self.complete_end = False
+
+    def insert(self, key):
+        """Show a key added to the collection, if it falls within the
+        loaded ones; otherwise it is found when paging gets there."""
+        if self.prefix and not key.startswith(self.prefix):
+            return
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return
+        if (i == 0 and not self.complete_start) or (i == len(self.keys) and not self.complete_end):
+            return
+        self.keys.insert(i, key)
+        if self.focus is None:
+            self.focus = key
+        self._modified()
+
+    def positions(self, reverse=False):
+        """The loaded positions, after jumping to the first or last page;
+        enough for home and end."""
+        if reverse and not self.complete_end:
+            self.drop(self.keys)
+            self.keys = list(reversed(self.scan(limit=self.page_size, reverse=True)))
+            self.complete_start = len(self.keys) < self.page_size
+            self.complete_end = True
+        if not reverse and not self.complete_start:
+            self.drop(self.keys)
+            self.keys = list(self.scan(limit=self.page_size))
+            self.complete_start = True
+            self.complete_end = len(self.keys) < self.page_size
+        return reversed(self.keys) if reverse else iter(self.keys)
+
+    def drop(self, keys):
+        for key in keys:
+            self._widgets.pop(key, None)
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
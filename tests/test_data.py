@@ -0,0 +1,120 @@
+import sqlite3
+import pytest
+from enpda.data import Data
+
+def test_writer_coalesces_and_reports(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    data.start_writer()
+    done = []
+    for i in range(20):
+        data.set_value('note', 'a', 'v%d' % i, done.append)
+    data.delete_value('note', 'b')
+    assert data.get_value('note', 'a') == 'v19'
+    data.flush()
+    assert done == [None] * 20
+    assert Data(str(tmp_path / 'data.db')).get_value('note', 'a') == 'v19'
+
+def test_pending_values_read_as_stored(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    data.start_writer()
+    data.writer.lock.acquire()
+    try:
+        data.set_value('count', 'a', 3)
+        assert data.get_value('count', 'a') == '3'
+    finally:
+        data.writer.lock.release()
+    data.flush()
+    assert data.get_value('count', 'a') == '3'
+
+def test_writer_survives_errors(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    data.start_writer()
+    data.dbpath = str(tmp_path / 'missing' / 'data.db')
+    errors = []
+    data.set_value('note', 'a', 'x', errors.append)
+    data.flush()
+    assert len(errors) == 1 and isinstance(errors[0], sqlite3.Error)
+    assert data.get_value('note', 'a') is None
+
+    data.dbpath = str(tmp_path / 'data.db')
+    data.set_value('note', 'a', 'y', errors.append)
+    data.flush()
+    assert errors[1:] == [None]
+    assert data.get_value('note', 'a') == 'y'
+
+def test_batch_takes_the_write_lock(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    other = sqlite3.connect(str(tmp_path / 'data.db'), timeout=0)
+    with data.batch():
+        data.get_value('note', 'a')
+        with pytest.raises(sqlite3.OperationalError):
+            other.execute("INSERT INTO dynamo VALUES ('note', 'a', 'x')")
+    other.execute("INSERT INTO dynamo VALUES ('note', 'a', 'x')")
+    other.commit()
+
+def dynamo_sql(path):
+    db = sqlite3.connect(path)
+    sql, = next(db.execute("SELECT sql FROM sqlite_master WHERE name='dynamo'"))
+    db.close()
+    return sql
+
+def test_new_database_is_current(tmp_path):
+    path = str(tmp_path / 'data.db')
+    data = Data(path)
+    assert data.schema == Data.schema_version
+    assert data.get_config('schema') == str(Data.schema_version)
+    assert 'WITHOUT ROWID' in dynamo_sql(path)
+
+def test_migrate_2(tmp_path):
+    path = str(tmp_path / 'data.db')
+    db = sqlite3.connect(path)
+    db.executescript('''
+        CREATE TABLE dynamo (
+            hashkey VARCHAR NOT NULL,
+            sortkey VARCHAR NOT NULL,
+            value TEXT,
+            unique(hashkey, sortkey)
+        );
+        INSERT INTO dynamo VALUES ('config', 'schema', '1');
+        INSERT INTO dynamo VALUES ('note', 'b', 'B');
+        INSERT INTO dynamo VALUES ('note', 'a', 'A');
+    ''')
+    db.close()
+
+    data = Data(path)
+    assert data.schema == 2
+    assert data.get_config('schema') == '2'
+    assert 'WITHOUT ROWID' in dynamo_sql(path)
+    assert [row[1:] for row in data.scan('note')] == [('a', 'A'), ('b', 'B')]
+
+def test_get_many(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    data.insert_many('item', [(i, 'v%d' % i) for i in range(0, 1200, 2)])
+    # More keys than one IN query takes.
+    values = data.get_many('item', range(1200))
+    assert values == {str(i): 'v%d' % i for i in range(0, 1200, 2)}
+
+    # Misses are cached too, so asking again doesn't query.
+    misses = data.misses
+    assert data.get_many('item', [1197, 1198]) == {'1198': 'v1198'}
+    assert data.misses == misses
+
+    data.start_writer()
+    data.writer.lock.acquire()
+    try:
+        data.set_value('item', 1, 'new')
+        data.delete_value('item', 2)
+        assert data.get_many('item', [1, 2, 4]) == {'1': 'new', '4': 'v4'}
+    finally:
+        data.writer.lock.release()
+    data.flush()
+    assert data.get_many('item', [1, 2, 4]) == {'1': 'new', '4': 'v4'}
+
+def test_insert_many_is_all_or_nothing(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    data.insert('item', 'b', 'old')
+    assert data.get_many('item', ['a', 'b']) == {'b': 'old'}
+    with pytest.raises(sqlite3.IntegrityError):
+        data.insert_many('item', [('a', 1), ('b', 2), ('c', 3)])
+    assert data.get_many('item', ['a', 'b', 'c']) == {'b': 'old'}
+    assert Data(str(tmp_path / 'data.db')).get_many('item', ['a', 'b', 'c']) == {'b': 'old'}
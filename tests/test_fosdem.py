@@ -0,0 +1,139 @@
+import os
+import threading
+from enpda.app import App
+from enpda.data import Data
+from enpda.fosdem import Fosdem, FosdemTimes, FosdemView, minutes
+
+def schedule(events):
+    return '<schedule><day index="1" date="2020-02-01">%s</day></schedule>' % ''.join(
+        '''<event id="%s"><title>%s</title><track>Main</track><room>K</room>
+        <start>10:00</start><duration>00:30</duration>
+        <abstract>%s</abstract><persons><person id="1">Ann</person></persons>
+        </event>''' % event for event in events
+    )
+
+def write(path, events, mtime):
+    with open(path, 'w') as fh:
+        fh.write(schedule(events))
+    os.utime(path, ns=(mtime, mtime))
+
+def test_refresh_diff(tmp_path):
+    path = str(tmp_path / 'fosdem.xml')
+    data = Data(str(tmp_path / 'data.db'))
+    write(path, [('1', 'One', 'first'), ('2', 'Two', 'second'), ('3', 'Three', 'third')], 10**18)
+    fosdem = Fosdem.from_file(path, data)
+    one = fosdem.get_event('1')
+
+    write(path, [('1', 'One', 'changed'), ('2', 'Two', 'second'), ('4', 'Four', 'fourth')],
+          2 * 10**18)
+    assert fosdem.changed_on_disk()
+    diff = fosdem.refresh()
+    assert bool(diff)
+    assert [ev.fosdem_id for ev in diff.changed] == ['1']
+    assert [ev.fosdem_id for ev in diff.added] == ['4']
+    assert [ev.fosdem_id for ev in diff.removed] == ['3']
+    assert str(diff) == 'schedule updated: 1 added, 1 removed, 1 changed'
+    assert fosdem.get_event('1') is one
+    assert 'changed' in one.description
+
+    os.utime(path, ns=(3 * 10**18, 3 * 10**18))
+    assert not fosdem.refresh()
+
+def test_refresh_forgets_plain_text(tmp_path):
+    path = str(tmp_path / 'fosdem.xml')
+    data = Data(str(tmp_path / 'data.db'))
+    write(path, [('1', 'One', 'first')], 10**18)
+    fosdem = Fosdem.from_file(path, data)
+    one = fosdem.get_event('1')
+    assert 'first' in one.description
+
+    write(path, [('1', 'One', 'second')], 2 * 10**18)
+    assert [ev.fosdem_id for ev in fosdem.refresh().changed] == ['1']
+    assert 'second' in one.description
+
+def test_refresh_with_the_search_open(tmp_path):
+    path = str(tmp_path / 'fosdem.xml')
+    write(path, [('1', 'Talk one', 'first'), ('2', 'Other', 'second')], 10**18)
+    app = App('enpda', [('fosdem', lambda app: FosdemView(
+        app, fosdem=Fosdem.from_file(path, app.data, favorites=app.favorites)
+    ))], dbpath=str(tmp_path / 'data.db'))
+    view = app.contents['body'][0]
+    size = (80, 24)
+    for key in '/ta':
+        view.keypress(size, key)
+    assert view.focus_position == 'footer'
+
+    write(path, [('1', 'Talk one', 'first'), ('3', 'Talk three', 'third')], 2 * 10**18)
+    view.poll(None)
+    view.keypress(size, 'l')
+    eventlist = view.fosdem_view.panes.eventlist
+    assert sorted(ev.fosdem_id for ev in view.search.query('talk')) == ['1', '3']
+    assert eventlist.list.w is not None
+
+def test_refresh_precomputes_texts(tmp_path):
+    path = str(tmp_path / 'fosdem.xml')
+    data = Data(str(tmp_path / 'data.db'))
+    write(path, [('1', 'One', 'first')], 10**18)
+    fosdem = Fosdem.from_file(path, data)
+    fosdem.precompute_texts().join()
+
+    write(path, [('1', 'One', 'second')], 2 * 10**18)
+    fosdem.refresh()
+    for thread in threading.enumerate():
+        if thread.name == 'precompute-texts':
+            thread.join()
+    assert 'second' in fosdem.text_source.get_text('1')
+
+def timetable(events):
+    """A Fosdem of (id, date, room, start, duration) events."""
+    fosdem = Fosdem(None, None)
+    fosdem.add_day(1)
+    fosdem.add_track('Main', 1, '2020-02-01', 'K')
+    for fosdem_id, date, room, start, duration in events:
+        fosdem.add_event(
+            date=date, fosdem_id=fosdem_id, title=fosdem_id, authors=[], track='Main',
+            room=room, duration=duration, start_time=start,
+        )
+    return fosdem
+
+def test_now_next():
+    fosdem = timetable([
+        ('a', '2020-02-01', 'K', '10:00', '00:30'),
+        ('b', '2020-02-01', 'K', '10:30', '00:30'),
+        ('c', '2020-02-01', 'K', '11:00', '00:30'),
+        ('d', '2020-02-01', 'H', '09:00', '00:30'),
+        ('e', '2020-02-02', 'K', '10:00', '00:30'),
+        ('f', '2020-02-01', 'U', None, None),
+    ])
+    times = FosdemTimes(fosdem.events)
+    now_next = lambda hhmm: [ev.fosdem_id for ev in times.now_next('2020-02-01', minutes(hhmm))]
+    # Running now and next in the same room; H has nothing left.
+    assert now_next('10:15') == ['a', 'b']
+    # An event is over at its end minute, and the next one has begun.
+    assert now_next('10:30') == ['b', 'c']
+    assert now_next('08:00') == ['d', 'a']
+    assert now_next('09:10') == ['d', 'a']
+    assert now_next('12:00') == []
+    assert times.now_next('2020-02-03', 600) == []
+
+def test_clashes():
+    fosdem = timetable([
+        ('a', '2020-02-01', 'K', '10:00', '00:30'),
+        ('b', '2020-02-01', 'H', '10:30', '00:30'),
+        ('c', '2020-02-01', 'U', '10:45', '01:00'),
+        ('d', '2020-02-01', 'K', '11:30', '00:30'),
+        ('e', '2020-02-01', 'H', '11:40', '00:10'),
+        ('f', '2020-02-02', 'K', '10:00', '00:30'),
+        ('g', '2020-02-02', 'H', '10:00', '00:30'),
+        ('h', '2020-02-03', 'K', '10:00', '00:30'),
+    ])
+    clashing = [ev.fosdem_id for ev in FosdemTimes.clashes(fosdem.events)]
+    # a and b are back to back; c overlaps b and d, d and e overlap.
+    assert clashing[:4] == ['b', 'c', 'd', 'e']
+    # f and g start at the same time, in either order.
+    assert sorted(clashing[4:]) == ['f', 'g']
+    # Only the given events count, favorites say.
+    favorites = [fosdem.get_event(i) for i in 'abh']
+    assert FosdemTimes.clashes(favorites) == []
+    assert [ev.fosdem_id for ev in FosdemTimes.clashes(
+        [fosdem.get_event(i) for i in 'ce'])] == ['c', 'e']
@@ -0,0 +1,53 @@
+import io
+import datetime
+import pytest
+from enpda import ical
+
+def test_unfold():
+    text = io.StringIO('SUMMARY:a long\r\n  title\r\n\tgoes on\r\nLOCATION:K\r\n')
+    assert list(ical.unfold(text)) == ['SUMMARY:a long titlegoes on', 'LOCATION:K']
+
+def test_split_line():
+    assert ical.split_line('ATTENDEE;CN="Doe: Jo";role=x:mailto:jo') == (
+        'ATTENDEE', {'CN': 'Doe: Jo', 'ROLE': 'x'}, 'mailto:jo',
+    )
+    assert ical.split_line('garbage') == ('GARBAGE', {}, '')
+
+def test_unescape():
+    assert ical.unescape(r'a\, b\; c\\d\ne\N') == 'a, b; c\\d\ne\n'
+
+def test_split_list():
+    assert ical.split_list(r'Rust\, Go,Python') == ['Rust, Go', 'Python']
+    assert ical.split_list(r'a\\,b') == ['a\\', 'b']
+    assert ical.split_list('') == ['']
+
+@pytest.mark.parametrize('value, expected', [
+    ('PT1H30M', datetime.timedelta(hours=1, minutes=30)),
+    ('P1D', datetime.timedelta(days=1)),
+    ('P1W', datetime.timedelta(weeks=1)),
+    ('P1DT2H', datetime.timedelta(days=1, hours=2)),
+    ('-PT15M', datetime.timedelta(minutes=-15)),
+    ('PT45S', datetime.timedelta(seconds=45)),
+])
+def test_parse_duration(value, expected):
+    assert ical.parse_duration(value) == expected
+
+def test_parse_duration_months():
+    with pytest.raises(ValueError):
+        ical.parse_duration('P1M')
+
+def test_parse_datetime():
+    assert ical.parse_datetime('20200201T103000Z') == datetime.datetime(2020, 2, 1, 10, 30)
+    assert ical.parse_datetime('20200201') == datetime.datetime(2020, 2, 1)
+
+def test_vevents():
+    fh = io.BytesIO(b'\r\n'.join([
+        b'BEGIN:VCALENDAR', b'X-WR-CALNAME:Conf',
+        b'BEGIN:VEVENT', b'UID:1', b'ATTENDEE;CN=A:x', b'ATTENDEE;CN=B:y',
+        b'BEGIN:VALARM', b'UID:alarm', b'END:VALARM',
+        b'END:VEVENT', b'END:VCALENDAR', b'',
+    ]))
+    events = list(ical.vevents(fh))
+    assert len(events) == 1
+    assert events[0]['UID'] == '1'
+    assert [params['CN'] for params, _ in events[0]['_all']['ATTENDEE']] == ['A', 'B']
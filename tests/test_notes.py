@@ -0,0 +1,39 @@
+from enpda.data import Data
+from enpda.notes import Editor, NoteDB
+
+class Loop:
+    def __init__(self):
+        self.alarms = []
+
+    def set_alarm_in(self, seconds, callback):
+        self.alarms.append(callback)
+        return callback
+
+    def remove_alarm(self, handle):
+        self.alarms.remove(handle)
+
+class App:
+    def __init__(self):
+        self.loop = Loop()
+
+def test_leaving_insert_mode_saves(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    notes = NoteDB(data)
+    app = App()
+    editor = Editor(notes.get_note('todo'), app)
+    size = (40, 10)
+    for key in ['i', 'a', 'b']:
+        editor.keypress(size, key)
+    assert len(app.loop.alarms) == 1
+    assert data.get_value('note', 'todo') is None
+
+    editor.keypress(size, 'esc')
+    assert app.loop.alarms == []
+    assert data.get_value('note', 'todo') == 'ab'
+    assert notes.search.query('ab') == ['todo']
+    assert notes.revisions.revisions('todo') == [0]
+
+    # Nothing typed, nothing saved.
+    editor.keypress(size, 'i')
+    editor.keypress(size, 'esc')
+    assert notes.revisions.revisions('todo') == [0]
@@ -0,0 +1,74 @@
+import random
+import threading
+from enpda.data import Data
+from enpda.notes import spans
+from enpda.revisions import NoteRevisions, RevisionValue, apply_delta, line_delta
+
+def test_line_delta():
+    old = 'a\nb\nc\nd\n'
+    assert line_delta(old, old) == [4]
+    assert line_delta(old, 'a\nb\nx\nd\n') == [2, -1, 'x\n', 1]
+    assert line_delta('', 'new\n') == ['new\n']
+    assert line_delta(old, '') == [-4]
+
+def test_apply_delta_round_trip():
+    rng = random.Random(1)
+    words = ['alpha\n', 'beta\n', 'gamma\n', 'delta\n', '\n', 'last']
+    for _ in range(200):
+        old = ''.join(rng.choices(words, k=rng.randint(0, 12)))
+        new = ''.join(rng.choices(words, k=rng.randint(0, 12)))
+        assert apply_delta(old, line_delta(old, new)) == new
+
+def test_revision_value_is_worked_out_once():
+    value = RevisionValue('a\n', 'a\nb\n')
+    assert value.value is None
+    assert str(value) == '{"delta": [1, "b\\n"]}'
+    assert str(RevisionValue(None, 'x')) == '{"full": "x"}'
+
+def test_add_and_get(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    data.start_writer()
+    revisions = NoteRevisions(data)
+    texts = ['line %d\n' % i * (i + 1) for i in range(40)]
+    for i, text in enumerate(texts):
+        assert revisions.add('n', text) == i
+    assert revisions.add('n', texts[-1]) == 39
+    data.flush()
+
+    fresh = NoteRevisions(Data(str(tmp_path / 'data.db')))
+    assert fresh.revisions('n') == list(range(40))
+    assert all(fresh.get('n', i) == text for i, text in enumerate(texts))
+
+def test_compaction_keeps_what_is_listed(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    revisions = NoteRevisions(data)
+    revisions.keep = 16
+    for i in range(50):
+        revisions.add('n', 'v%d\n' % i)
+    revisions.compact('n', 49)
+    data.clear_cache()
+    available = revisions.revisions('n')
+    assert available == [0, 16] + list(range(32, 50))
+    assert spans(available) == '0, 16, 32-49'
+    assert all(revisions.get('n', i) == 'v%d\n' % i for i in available)
+
+def test_compaction_is_queued(tmp_path):
+    revisions = NoteRevisions(Data(str(tmp_path / 'data.db')))
+    started, release, done = threading.Event(), threading.Event(), threading.Event()
+    calls = []
+
+    def compact(title, latest):
+        calls.append(latest)
+        started.set()
+        release.wait()
+        if len(calls) == 2:
+            done.set()
+    revisions.compact = compact
+
+    revisions.compact_in_background('n', 96)
+    started.wait()
+    revisions.compact_in_background('n', 112)
+    revisions.compact_in_background('n', 128)
+    release.set()
+    assert done.wait(5)
+    assert calls == [96, 128]
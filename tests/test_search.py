@@ -0,0 +1,45 @@
+from enpda.data import Data
+from enpda.search import NoteSearch, TitleMatcher
+
+def test_note_search_follows_writes(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    data.set_value('note', 'old', 'written before the index')
+    search = NoteSearch(data)
+    assert search.query('befo') == ['old']
+
+    data.set_value('note', 'direct', 'apples and pears')
+    assert search.query('apple') == ['direct']
+
+    data.start_writer()
+    data.set_value('note', 'deferred', 'plums')
+    data.set_value('note', 'direct', 'only pears now')
+    data.flush()
+    assert search.query('plum') == ['deferred']
+    assert search.query('apple') == []
+    data.delete_value('note', 'deferred')
+    data.flush()
+    assert search.query('plum') == []
+
+def test_note_search_rolls_back_with_the_note(tmp_path):
+    data = Data(str(tmp_path / 'data.db'))
+    search = NoteSearch(data)
+    data.start_writer()
+    errors = []
+    data.add_write_hook('note', lambda *args: 1 / 0)
+    data.set_value('note', 'a', 'cherries', errors.append)
+    data.flush()
+    assert isinstance(errors[0], ZeroDivisionError)
+    assert data.get_value('note', 'a') is None
+
+    data.add_write_hook('note', search.update)
+    data.set_value('note', 'a', 'cherries', errors.append)
+    data.flush()
+    assert errors[1:] == [None]
+    assert search.query('cherr') == ['a']
+
+def test_title_matcher():
+    matcher = TitleMatcher(['shopping list', 'todo', 'shell notes'])
+    assert matcher.match('sho') == ['shopping list', 'shell notes']
+    assert matcher.match('shop') == ['shopping list']
+    matcher.add('shop hours')
+    assert matcher.match('shop') == ['shop hours', 'shopping list']
@@ -0,0 +1,254 @@
+import os
+import gzip
+import pytest
+from enpda.app import App
+from enpda.syslog import (
+    SyslogFile, SyslogGzipFile, SyslogIndex, SyslogLine, SyslogQuery, SyslogTimeline,
+    SyslogView, SyslogWalker, parse_columns, parse_range, split_ranges, time_key,
+)
+
+def test_time_key_orders_within_a_year():
+    assert time_key('Feb 1', '10:00:00') < time_key('Feb 1', '10:00:01')
+    assert time_key('Jan 31', '23:59:59') < time_key('Feb 1', '00:00:00')
+    assert time_key('Feb 1', '10:00') == time_key('Feb 1', '10:00:00')
+    assert time_key('Foo 1', '10:00') is None
+
+def test_query_fields():
+    q = SyslogQuery('service:sshd host:box since:"Feb 1 10:00" until:"Feb 1 11:00"')
+    assert (q.service, q.host) == ('sshd', 'box')
+    assert q.since == time_key('Feb 1', '10:00')
+    assert q.until == time_key('Feb 1', '11:00')
+
+def test_query_date_only_is_midnight():
+    assert SyslogQuery('since:"Feb 1"').since == time_key('Feb 1', '00:00')
+
+def test_query_time_only_uses_default_date():
+    assert SyslogQuery('since:10:00', default_date='Feb  3').since == time_key('Feb 3', '10:00')
+
+def test_query_errors():
+    with pytest.raises(ValueError):
+        SyslogQuery('since:soon')
+    with pytest.raises(ValueError):
+        SyslogQuery('colour:red')
+
+def test_query_match():
+    entry = SyslogLine('Feb  1 10:30:00 box sshd[12]: accepted')
+    assert SyslogQuery('service:sshd since:"Feb 1"').match(entry)
+    assert not SyslogQuery('service:cron').match(entry)
+    assert not SyslogQuery('until:"Feb 1 10:00"').match(entry)
+
+def write_log(path, count):
+    lines = [
+        'Feb  1 10:%02d:%02d host%d svc%d[1]: message %d\n' % (i // 60 % 60, i % 60, i % 2, i % 3, i)
+        for i in range(count)
+    ]
+    lines[5] = 'not a syslog line\n'
+    path.write_text(''.join(lines))
+    return lines
+
+def test_split_ranges_cut_at_line_boundaries(tmp_path):
+    path = tmp_path / 'syslog'
+    write_log(path, 200)
+    data = path.read_bytes()
+    ranges = split_ranges(str(path), 0, len(data), 7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    for (_, hi), (lo, _) in zip(ranges, ranges[1:]):
+        assert hi == lo and data[lo - 1:lo] == b'\n'
+
+def test_parse_range(tmp_path):
+    path = tmp_path / 'syslog'
+    lines = write_log(path, 20)
+    start = len(lines[0])
+    end = sum(map(len, lines[:10]))
+    cols = parse_range(str(path), start, end)
+    assert len(cols) == 9
+    assert cols.offsets[0] == start
+    assert cols.offsets[-1] == end - len(lines[9])
+    assert cols.times[4] == -1
+    assert cols.service_names[cols.services[4]] == 'unknown'
+    assert cols.times[0] == time_key('Feb 1', '10:00:01')
+    assert cols.host_names[cols.hosts[0]] == 'host1'
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parse_columns_matches_a_single_range(tmp_path, workers):
+    path = tmp_path / 'syslog'
+    write_log(path, 500)
+    whole = parse_range(str(path), 0, path.stat().st_size)
+    cols = parse_columns(str(path), workers=workers, chunk_size=1024)
+    assert list(cols.offsets) == list(whole.offsets)
+    assert list(cols.times) == list(whole.times)
+    assert [cols.service_names[i] for i in cols.services] == \
+        [whole.service_names[i] for i in whole.services]
+
+class Loop:
+    def __init__(self):
+        self.alarms = []
+
+    def set_alarm_in(self, seconds, callback):
+        self.alarms.append(callback)
+        return callback
+
+    def remove_alarm(self, handle):
+        self.alarms.remove(handle)
+
+def syslog_app(tmp_path, path):
+    return App('enpda', [('syslog', lambda app: SyslogView(app, logpath=str(path)))],
+               dbpath=str(tmp_path / 'data.db'))
+
+def test_follow_keeps_one_poll_pending(tmp_path):
+    path = tmp_path / 'syslog'
+    write_log(path, 20)
+    app = syslog_app(tmp_path, path)
+    view = app.contents['body'][0]
+    app.loop = Loop()
+    view.toggle_follow()
+    view.toggle_follow()
+    assert len(app.loop.alarms) == 1
+    view.toggle_follow()
+    assert app.loop.alarms == []
+    view.toggle_follow()
+    app.loop.alarms.pop()(app.loop)
+    assert len(app.loop.alarms) == 1
+
+def test_index_merges_the_year_rollover(tmp_path, monkeypatch):
+    path = tmp_path / 'syslog'
+    lines = ['Dec 31 23:59:%02d host svc[1]: old %d\n' % (i, i) for i in range(50)]
+    lines += ['Jan  1 00:00:%02d host svc[1]: new %d\n' % (i, i) for i in range(50)]
+    path.write_text(''.join(lines))
+    logfile = SyslogFile(str(path))
+    offsets = [sum(map(len, lines[:i])) for i in range(len(lines))]
+
+    index = SyslogIndex()
+    assert index.update(logfile) is None
+    assert list(index.time_keys) == sorted(index.time_keys)
+    assert list(index.time_offsets) == offsets[50:] + offsets[:50]
+    assert list(index.services['svc']) == offsets
+
+    monkeypatch.setattr(SyslogIndex, 'parallel_threshold', 0)
+    parallel = SyslogIndex()
+    parallel.update(logfile, parallel=True)
+    assert list(parallel.time_offsets) == list(index.time_offsets)
+
+    with open(str(path), 'a') as fh:
+        fh.write('Jan  1 00:01:00 host other[1]: appended\n')
+    logfile.read_forward()
+    entries = index.update(logfile, collect=True)
+    assert [(offset, entry.service) for offset, entry in entries] == \
+        [(sum(map(len, lines)), 'other')]
+
+def log_lines(first, count):
+    return ['Feb  1 10:00:00 host svc[1]: line %d\n' % i for i in range(first, first + count)]
+
+def rotated_logs(tmp_path):
+    """syslog.2.gz, syslog.1 and syslog, with lines 0-99, 100-199 and
+    200-249 in them."""
+    path = tmp_path / 'syslog'
+    with gzip.open(str(tmp_path / 'syslog.2.gz'), 'wt') as fh:
+        fh.write(''.join(log_lines(0, 100)))
+    (tmp_path / 'syslog.1').write_text(''.join(log_lines(100, 100)))
+    path.write_text(''.join(log_lines(200, 50)))
+    cachedir = tmp_path / 'cache'
+    cachedir.mkdir()
+    return path, str(cachedir)
+
+def walk(timeline, position, step):
+    lines = []
+    while True:
+        lines.append(timeline.line(position) + '\n')
+        try:
+            position = step(position)
+        except IndexError:
+            return lines
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(SyslogFile, 'block_size', 100)
+    monkeypatch.setattr(SyslogGzipFile, 'chunk_size', 300)
+
+def test_timeline_walks_across_archives(tmp_path, small_blocks):
+    path, cachedir = rotated_logs(tmp_path)
+    timeline = SyslogTimeline(SyslogFile(str(path)), cachedir)
+    assert timeline.archives == [str(path) + '.1', str(path) + '.2.gz']
+    last = timeline.last()
+    assert last[0] == 0
+    assert walk(timeline, last, timeline.prev_offset) == log_lines(0, 250)[::-1]
+    first = timeline.first()
+    assert first == (-2, 0)
+    assert walk(timeline, first, timeline.next_offset) == log_lines(0, 250)
+    timeline.close()
+
+def test_gzip_index_is_cached(tmp_path, small_blocks, monkeypatch):
+    path, cachedir = rotated_logs(tmp_path)
+    archive = str(path) + '.2.gz'
+    built = SyslogGzipFile(archive, cachedir)
+    assert len(built.chunk_starts) > 1
+
+    def build_index(self):
+        raise AssertionError('index rebuilt')
+    monkeypatch.setattr(SyslogGzipFile, 'build_index', build_index)
+    cached = SyslogGzipFile(archive, cachedir)
+    assert list(cached.offsets) == list(built.offsets)
+    assert list(cached.chunk_pos) == list(built.chunk_pos)
+    assert cached.end == built.end
+    assert [cached.line(o) + '\n' for o in cached.offsets] == log_lines(0, 100)
+
+    # A different archive under the same name is indexed again.
+    os.utime(archive, ns=(0, 0))
+    with pytest.raises(AssertionError):
+        SyslogGzipFile(archive, cachedir)
+
+def test_read_back_and_forward(tmp_path, small_blocks):
+    path = tmp_path / 'syslog'
+    lines = log_lines(0, 30)
+    path.write_text(''.join(lines))
+    logfile = SyslogFile(str(path))
+    assert logfile.last() == len(''.join(lines[:-1]))
+    assert len(logfile) < 30
+    assert logfile.first() == 0
+    assert logfile.complete and len(logfile) == 30
+
+    with open(str(path), 'a') as fh:
+        fh.write('Feb  1 10:00:01 host svc[1]: part')
+    end = len(''.join(lines))
+    assert logfile.read_forward() == ([end], None)
+    with open(str(path), 'a') as fh:
+        fh.write('ial\nFeb  1 10:00:02 host svc[1]: next\n')
+    starts, grown = logfile.read_forward()
+    assert grown == end
+    assert starts == [end + len('Feb  1 10:00:01 host svc[1]: partial\n')]
+    assert logfile.line(grown) == 'Feb  1 10:00:01 host svc[1]: partial'
+    assert logfile.read_forward() == ([], None)
+
+def test_follow_across_truncation_and_rotation(tmp_path):
+    path, cachedir = rotated_logs(tmp_path)
+    walker = SyslogWalker(SyslogFile(str(path)), lambda line: line, cachedir)
+    assert walker[walker.focus] == log_lines(249, 1)[0].rstrip('\n')
+    assert not walker.follow()
+
+    with open(str(path), 'a') as fh:
+        fh.write(''.join(log_lines(250, 2)))
+    assert walker.follow()
+    assert walker[walker.focus] == 'Feb  1 10:00:00 host svc[1]: line 251'
+
+    walker.set_filter(SyslogQuery('service:other'))
+    assert walker.focus is None
+    with open(str(path), 'a') as fh:
+        fh.write('Feb  1 10:00:01 host other[1]: filtered\n')
+    assert walker.follow()
+    assert walker[walker.focus] == 'Feb  1 10:00:01 host other[1]: filtered'
+    walker.set_filter(None)
+
+    # Truncated in place.
+    path.write_text(''.join(log_lines(300, 3)))
+    assert walker.follow()
+    assert walker[walker.focus] == 'Feb  1 10:00:00 host svc[1]: line 302'
+
+    # Rotated: the old log becomes syslog.1 and a new one is started.
+    os.rename(str(tmp_path / 'syslog.1'), str(tmp_path / 'syslog.3'))
+    os.rename(str(path), str(tmp_path / 'syslog.1'))
+    path.write_text(''.join(log_lines(400, 1)))
+    assert walker.follow()
+    assert walker[walker.focus] == 'Feb  1 10:00:00 host svc[1]: line 400'
+    assert walker.timeline.archives[0] == str(tmp_path / 'syslog.1')
+    assert walker[walker.prev_position(walker.focus)] == \
+        'Feb  1 10:00:00 host svc[1]: line 302'
@@ -0,0 +1,85 @@
+import random
+from enpda.textbuffer import BufferView, Fenwick, TextBuffer
+
+def test_fenwick():
+    counts = [3, 0, 5, 1, 4]
+    tree = Fenwick(counts)
+    assert [tree.prefix(i) for i in range(6)] == [0, 3, 3, 8, 9, 13]
+    assert tree.search(0) == (0, 0)
+    assert tree.search(2) == (0, 2)
+    assert tree.search(3) == (2, 0)
+    assert tree.search(8) == (3, 0)
+    assert tree.search(12) == (4, 3)
+    tree.add(1, 2)
+    assert [tree.prefix(i) for i in range(6)] == [0, 3, 5, 10, 11, 15]
+    assert tree.search(3) == (1, 0)
+
+def test_text_buffer_matches_a_string(monkeypatch):
+    # Small chunks, so edits cross chunk boundaries and split them.
+    monkeypatch.setattr(TextBuffer, 'chunk_size', 8)
+    rng = random.Random(1)
+    text = 'one\ntwo\n\nthree four five\nsix'
+    buf = TextBuffer(text)
+    for _ in range(300):
+        offset = rng.randint(0, len(text))
+        if rng.random() < 0.6:
+            insert = rng.choice(['x', '\n', 'abc\ndef', 'long insert ' * 3])
+            buf.insert(offset, insert)
+            text = text[:offset] + insert + text[offset:]
+        else:
+            end = offset + rng.randint(0, 20)
+            buf.delete(offset, end)
+            text = text[:offset] + text[end:]
+        assert buf.text() == text
+        assert len(buf) == len(text)
+        lines = text.split('\n')
+        assert buf.lines == len(lines)
+        row = rng.randrange(len(lines))
+        assert buf.line(row) == lines[row]
+        assert buf.line_of(buf.line_start(row)) == row
+        start = rng.randint(0, len(text))
+        assert buf.text(start, start + 5) == text[start:start + 5]
+        assert ''.join(buf.chars(start)) == text[start:]
+        assert ''.join(buf.chars_back(start)) == text[:start][::-1]
+
+def test_motions():
+    view = BufferView('foo bar.baz\n  qux')
+    view.move('w')
+    assert view.cursor == 4
+    view.move('w')
+    assert view.cursor == 7
+    view.move('$')
+    assert view.position() == (0, 11)
+    view.move('j')
+    assert view.position() == (1, 5)
+    view.move('b')
+    assert view.position() == (1, 2)
+    view.move('G')
+    view.move('g')
+    assert view.cursor == 0
+
+def test_wide_characters():
+    view = BufferView('日本語日本語\nabcdefgh')
+    assert view.line_rows(0, 5) == 3
+    assert view.line_rows(1, 5) == 2
+    view.set_cursor(3)
+    canvas = view.render((5, 10), focus=True)
+    assert canvas.cursor == (2, 1)
+    # Down keeps the display column, not the character count.
+    view.move('j')
+    assert view.position() == (1, 6)
+    view.set_cursor(view.buffer.line_start(1) + 4)
+    view.move('k')
+    assert view.position() == (0, 2)
+
+def test_tabs():
+    view = BufferView('a\tb')
+    view.set_cursor(2)
+    assert view.render((20, 2), focus=True).cursor == (8, 0)
+
+def test_scroll_keeps_the_cursor_on_screen():
+    view = BufferView('\n'.join(['x' * 25] * 10))
+    view.set_cursor(len(view.buffer))
+    canvas = view.render((10, 4), focus=True)
+    assert canvas.rows() == 4
+    assert canvas.cursor == (5, 2)